@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+import math
+from subprocess import call
+
+try: # pyalsaaudio is optional, amixer is used if not installed
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
+class AlsaMixer():
+    """
+        This class controls the volume of an ALSA mixer control. 
+        The mixer handle is opened once (pyalsaaudio) and kept open for 
+        the program lifetime, so that a volume change is a direct call
+        to the ALSA mixer API. The volume percentage follows the same 
+        mapped (perceptual) scale as "amixer -M". 
+        If pyalsaaudio is not available or the control cannot be opened, 
+        the volume is set by calling amixer. 
+    """
+    MAX_LINEAR_DB_SCALE = 2400 # Same as alsa-utils : below a 24 dB range, the dB scale is linear (in 0.01 dB)
+
+    def __init__(self, control):
+        self._control = control
+        self._mixer = None
+        self._db_range = None
+        if alsaaudio is not None:
+            try:
+                self._mixer = alsaaudio.Mixer(control)
+                self._db_range = self.__get_db_range()
+            except Exception as e: # Cannot open the mixer, using amixer instead
+                print ("ALSA mixer not available ("+str(e)+"), using amixer")
+                self._mixer = None
+
+    def set_volume(self, volume):
+        """
+            Sets the volume of the control (percent, mapped scale).
+        """
+        if self._mixer is not None:
+            try:
+                if self._db_range is not None:
+                    self._mixer.setvolume(self.__get_mapped_db_volume(volume), units=alsaaudio.VOLUME_UNITS_DB)
+                else:
+                    self._mixer.setvolume(volume)
+                return
+            except Exception as e:
+                print ("ALSA mixer error ("+str(e)+"), using amixer")
+                self._mixer = None
+        call(["amixer", "-M", "-q", "set", self._control, str(volume)+"%"])
+
+    def __get_db_range(self):
+        """
+            Returns the (min, max) dB range of the control (in 0.01 dB), 
+            or None if not available (old pyalsaaudio or control without dB info). 
+        """
+        try:
+            min_db, max_db = self._mixer.getrange(units=alsaaudio.VOLUME_UNITS_DB)
+        except (AttributeError, TypeError):
+            return None
+        if min_db >= max_db:
+            return None
+        return (min_db, max_db)
+
+    def __get_mapped_db_volume(self, volume):
+        """
+            Converts a volume percentage to a dB value, with the volume 
+            mapping used by alsa-utils (amixer -M). 
+        """
+        min_db, max_db = self._db_range
+        normalized = min(max(volume, 0), 100)/100
+        if max_db-min_db <= AlsaMixer.MAX_LINEAR_DB_SCALE:
+            return int(round(normalized*(max_db-min_db)))+min_db
+        if normalized <= 0:
+            return min_db
+        min_norm = math.pow(10, (min_db-max_db)/6000.0)
+        normalized = normalized*(1-min_norm)+min_norm
+        return int(round(6000.0*math.log10(normalized)))+max_db
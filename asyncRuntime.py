@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+import asyncio
+
+class AsyncRuntime():
+    """
+        This class runs the radiobot main loop on an asyncio event loop.
+        Radio info polling is a task sleeping until its next deadline
+        (no fixed-period polling, the player supervises itself with the
+        libVLC events), metadata fetches run in the radio manager worker
+        pool and GPIO callbacks are bridged to the loop thread with
+        call_soon_threadsafe.
+    """
+    def __init__(self, radio_manager):
+        self._radio_manager = radio_manager
+        self._loop = None
+        self._wake_events = []
+
+    def run(self):
+        """
+            Runs the event loop until the program is interrupted.
+        """
+        asyncio.run(self.__main())
+
+    def call_threadsafe(self, function, *args):
+        """
+            Schedules a function call on the event loop thread.
+            Can be called from any thread (GPIO callbacks for example).
+            The function is called directly if the loop is not running yet.
+        """
+        if self._loop is None:
+            function(*args)
+        else:
+            self._loop.call_soon_threadsafe(function, *args)
+
+    async def __main(self):
+        self._loop = asyncio.get_running_loop()
+        self._radio_manager.set_radio_change_listener(self.__on_radio_change)
+        try:
+            await self.__radio_info_loop()
+        finally:
+            self._radio_manager.set_radio_change_listener(None)
+            self._loop = None
+
+    def __new_wake_event(self):
+        event = asyncio.Event()
+        self._wake_events.append(event)
+        return event
+
+    def __on_radio_change(self):
+        """
+            Radio change listener, wakes up the tasks so that they
+            compute their next deadline again.
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self.__wake_up)
+
+    def __wake_up(self):
+        for event in self._wake_events:
+            event.set()
+
+    async def __sleep(self, event, delay):
+        """
+            Sleeps for delay seconds or until the event is set.
+            Returns True if woken up by the event.
+        """
+        try:
+            await asyncio.wait_for(event.wait(), delay)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def __radio_info_loop(self):
+        """
+            Fetches the radio info each time the radio_info_check_interval
+            is reached and notifies the display.
+        """
+        wake_event = self.__new_wake_event()
+        while True:
+            wake_event.clear()
+            delay = self._radio_manager.get_info_check_delay()
+            if delay > 0 and await self.__sleep(wake_event, delay):
+                continue # Radio changed, the deadline must be computed again
+            self._radio_manager.reset_info_check_timer()
+            future = self._radio_manager.request_radio_info()
+            if future is not None: # The result is published by the loop thread when available
+                future.add_done_callback(self.__on_fetch_done)
+
+    def __on_fetch_done(self, future):
+        """
+            Done callback of the fetches (worker thread).
+        """
+        loop = self._loop
+        if loop is not None:
+            loop.call_soon_threadsafe(self.__publish_radio_info, future)
+
+    def __publish_radio_info(self, future):
+        """
+            Publishes the result of a fetch, and wakes up the tasks : the
+            fetch may have moved the next check (expected end of the song).
+        """
+        self.__wake_up()
+        if future.cancelled():
+            return
+        try:
+            generation, infos = future.result()
+            if len(infos) > 0:
+                self._radio_manager.publish_radio_info(infos, generation)
+        except Exception as e:
+            print (str(e))
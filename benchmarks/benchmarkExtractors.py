@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+import os
+import sys
+import gc
+import json
+import time
+import argparse
+import importlib
+import statistics
+import threading
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlsplit, urlunsplit
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARK_DIR, "fixtures")
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR)) # Radiobot modules
+
+import requests
+from requests.adapters import HTTPAdapter
+from httpSession import PooledHttpSession
+
+# Benchmarked extractor modules : module name -> (url of the payload, fixture file, content type)
+EXTRACTORS = {
+    "radioClassiqueModule": ("https://data.radioclassique.fr/XML_Metadata/direct_2.xml", "radioClassique.xml", "text/xml; charset=utf-8"),
+    "radioSwissClassicModule": ("http://www.radioswissclassic.ch/fr", "radioSwissClassic.html", "text/html; charset=utf-8"),
+    "franceMusiqueEasyModule": ("https://www.francemusique.fr/livemeta/pull/401", "franceMusiqueEasy.json", "application/json"),
+    "franceMusiquePlusModule": ("https://www.francemusique.fr/livemeta/pull/402", "franceMusiquePlus.json", "application/json"),
+}
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    """
+        Serves the recorded payloads, by path of their original url.
+        The timestamps of the livemeta timelines are shifted so that
+        the song in the middle of the timeline is the current one.
+    """
+    def do_GET(self):
+        fixture = self.server.fixtures.get(urlsplit(self.path).path)
+        if fixture is None:
+            self.send_error(404)
+            return
+        content_type, content = fixture
+        if content_type == "application/json":
+            content = self.__shift_timeline(content)
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def __shift_timeline(self, content):
+        tree = json.loads(content)
+        steps = sorted(tree.get("steps", {}).values(), key=lambda step: step["start"])
+        if len(steps) == 0:
+            return content
+        middle = steps[len(steps)//2]
+        shift = int(time.time())-middle["start"]-(middle["end"]-middle["start"])//2
+        for step in steps:
+            step["start"] += shift
+            step["end"] += shift
+        return json.dumps(tree).encode()
+
+    def log_message(self, format, *args): # No log for each request
+        pass
+
+class FixtureServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def run_fixture_server(port_queue):
+    """
+        Runs the stub HTTP server (in a separate process, so that its CPU
+        time and memory are not counted in the measures).
+    """
+    server = FixtureServer(("127.0.0.1", 0), FixtureRequestHandler)
+    server.fixtures = {}
+    for url, fixture, content_type in EXTRACTORS.values():
+        with open(os.path.join(FIXTURES_DIR, fixture), "rb") as f:
+            server.fixtures[urlsplit(url).path] = (content_type, f.read())
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+class LocalRedirectAdapter(HTTPAdapter):
+    """
+        Transport adapter sending all the requests to the stub server,
+        whatever the host of their url.
+    """
+    def __init__(self, port, **kwargs):
+        self._port = port
+        super(LocalRedirectAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        parts = urlsplit(request.url)
+        request.url = urlunsplit(("http", "127.0.0.1:"+str(self._port), parts.path, parts.query, ""))
+        return super(LocalRedirectAdapter, self).send(request, **kwargs)
+
+def create_session(port, threads):
+    """
+        Returns a session configured as the radiobot one, redirected to the stub server.
+    """
+    session = PooledHttpSession()
+    adapter = LocalRedirectAdapter(port, pool_maxsize=max(threads, PooledHttpSession.POOL_MAXSIZE))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def percentile(values, ratio):
+    values = sorted(values)
+    return values[min(int(len(values)*ratio), len(values)-1)]
+
+def measure_calls(module, session, url, iterations):
+    """
+        Measures the duration (wall clock and CPU) of the calls of a fresh
+        extractor (full download and parsing), and of the download alone.
+    """
+    for i in range(2): # Warm up (imports, connections)
+        module.RadioMetadataExtractor(session).retrieve_current_metadata()
+        session.get(url).content
+    fetch_times = []
+    call_times = []
+    cpu_times = []
+    found = 0
+    for i in range(iterations):
+        start = time.perf_counter()
+        session.get(url).content
+        fetch_times.append(time.perf_counter()-start)
+        extractor = module.RadioMetadataExtractor(session)
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        if extractor.retrieve_current_metadata():
+            found += 1
+        cpu_times.append(time.process_time()-cpu_start)
+        call_times.append(time.perf_counter()-start)
+    return {
+        "fetch_ms": statistics.median(fetch_times)*1000,
+        "call_ms": statistics.median(call_times)*1000,
+        "call_p95_ms": percentile(call_times, 0.95)*1000,
+        "parse_ms": max(statistics.median(call_times)-statistics.median(fetch_times), 0)*1000,
+        "cpu_ms": statistics.median(cpu_times)*1000,
+        "found": found,
+    }
+
+def measure_memory(module, session, iterations):
+    """
+        Measures the peak of traced memory during a call of a fresh extractor,
+        and the memory (size and number of blocks) still allocated after the
+        call, kept by the extractor or leaked. This is not the total of the
+        allocations of the call, the blocks freed during the call are not seen.
+    """
+    peaks = []
+    blocks = []
+    sizes = []
+    tracemalloc.start()
+    try:
+        for i in range(iterations):
+            extractor = module.RadioMetadataExtractor(session)
+            gc.collect()
+            before = tracemalloc.take_snapshot()
+            base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            extractor.retrieve_current_metadata()
+            peaks.append(tracemalloc.get_traced_memory()[1]-base)
+            gc.collect()
+            differences = tracemalloc.take_snapshot().compare_to(before, "filename")
+            blocks.append(sum(difference.count_diff for difference in differences))
+            sizes.append(sum(difference.size_diff for difference in differences))
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_kib": statistics.median(peaks)/1024,
+        "retained_kib": statistics.median(sizes)/1024,
+        "retained_blocks": int(statistics.median(blocks)),
+    }
+
+def measure_throughput(modules, session, threads, duration):
+    """
+        Polls all the modules from several threads for duration seconds
+        (shared session, as the worker pool of the radio manager).
+        Returns the number of calls per second, per module.
+    """
+    counts = dict((name, 0) for name in modules)
+    errors = dict((name, 0) for name in modules)
+    lock = threading.Lock()
+    deadline = time.monotonic()+duration
+
+    def poll(worker):
+        names = list(modules)
+        i = worker
+        while time.monotonic() < deadline:
+            name = names[i % len(names)]
+            i += 1
+            try:
+                modules[name].RadioMetadataExtractor(session).retrieve_current_metadata()
+                with lock:
+                    counts[name] += 1
+            except Exception:
+                with lock:
+                    errors[name] += 1
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for worker in range(threads):
+            executor.submit(poll, worker)
+    elapsed = time.monotonic()-start
+    return dict((name, {"calls_per_s": counts[name]/elapsed, "errors": errors[name]}) for name in modules)
+
+def record_fixtures(names):
+    """
+        Downloads the current payloads of the radios and saves them as fixtures.
+    """
+    for name in names:
+        url, fixture, content_type = EXTRACTORS[name]
+        req = requests.get(url, timeout=(5, 10))
+        req.raise_for_status()
+        with open(os.path.join(FIXTURES_DIR, fixture), "wb") as f:
+            f.write(req.content)
+        print ("Recorded "+url+" ("+str(len(req.content))+" bytes) to "+fixture)
+
+def print_report(results, throughput, threads):
+    print ("%-24s %8s %8s %8s %8s %8s %8s %9s %9s %8s %6s" % ("module", "KiB", "fetch", "call", "call p95", "parse", "cpu", "peak KiB", "retained", "ret blk", "found"))
+    for name, result in results.items():
+        print ("%-24s %8.1f %6.2fms %6.2fms %6.2fms %6.2fms %6.2fms %9.1f %9.1f %8d %6s" % (name, result["size_kib"], result["fetch_ms"], result["call_ms"], result["call_p95_ms"], result["parse_ms"], result["cpu_ms"], result["peak_kib"], result["retained_kib"], result["retained_blocks"], str(result["found"])+"/"+str(result["iterations"])))
+    if throughput is not None:
+        print ()
+        print ("Concurrent polling ("+str(threads)+" threads) : "+", ".join(name+" "+"%.1f" % result["calls_per_s"]+" calls/s" for name, result in throughput.items()))
+        print ("Total : "+"%.1f" % sum(result["calls_per_s"] for result in throughput.values())+" calls/s")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the metadata extractor modules against recorded payloads (local stub server).")
+    parser.add_argument("modules", nargs="*", help="modules to benchmark (all by default)")
+    parser.add_argument("--iterations", type=int, default=50, help="measured calls per module (default 50)")
+    parser.add_argument("--threads", type=int, default=4, help="threads of the concurrent polling (default 4, 0 to skip)")
+    parser.add_argument("--duration", type=float, default=5, help="duration of the concurrent polling in seconds (default 5)")
+    parser.add_argument("--json", action="store_true", help="print the results as json")
+    parser.add_argument("--record", action="store_true", help="download the current payloads to the fixtures (network needed)")
+    args = parser.parse_args()
+    names = args.modules or list(EXTRACTORS)
+    for name in names:
+        if name not in EXTRACTORS:
+            parser.error("unknown module "+name)
+
+    if args.record:
+        record_fixtures(names)
+        return
+
+    port_queue = multiprocessing.Queue()
+    server = multiprocessing.Process(target=run_fixture_server, args=(port_queue,), daemon=True)
+    server.start()
+    try:
+        port = port_queue.get(timeout=10)
+        session = create_session(port, args.threads)
+        modules = dict((name, importlib.import_module(name)) for name in names)
+        results = {}
+        for name, module in modules.items():
+            url, fixture, content_type = EXTRACTORS[name]
+            result = {"iterations": args.iterations, "size_kib": os.path.getsize(os.path.join(FIXTURES_DIR, fixture))/1024}
+            result.update(measure_calls(module, session, url, args.iterations))
+            result.update(measure_memory(module, session, max(args.iterations//5, 1)))
+            results[name] = result
+        throughput = None
+        if args.threads > 0:
+            throughput = measure_throughput(modules, session, args.threads, args.duration)
+    finally:
+        server.terminate()
+
+    if args.json:
+        print (json.dumps({"python": sys.version.split()[0], "extractors": results, "throughput": throughput, "threads": args.threads}, indent=2))
+    else:
+        print_report(results, throughput, args.threads)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+import time
+import threading
+from radioMetadataExtrator import AbstractRadioMetadataExtractor
+from metrics import REGISTRY
+
+# Latency of the metadata fetches (successful or not) of each extractor module
+FETCH_LATENCY = REGISTRY.histogram("radiobot_metadata_fetch_seconds", "Metadata fetch latency per extractor module", ("extractor",))
+
+class CircuitBreaker():
+    """
+        This class tracks the health of a remote service (failures and latencies).
+        After failure_threshold consecutive failures, the circuit is opened :
+        requests are refused during a backoff delay, doubled each time the 
+        circuit opens again (up to max_backoff). At the end of the delay, the 
+        circuit is half-opened and one probe request is allowed, which closes
+        the circuit on success or opens it again on failure. 
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+    LATENCY_SMOOTHING = 0.2 # Weight of the last request in the average latency
+
+    def __init__(self, name, failure_threshold=3, base_backoff=30, max_backoff=600):
+        self._name = name
+        self._failure_threshold = failure_threshold
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._state = CircuitBreaker.CLOSED
+        self._failures = 0 # Consecutive failures
+        self._opening_count = 0 # Consecutive openings of the circuit, for the exponential backoff
+        self._open_until = 0
+        self._probing = False
+        self._requests = 0
+        self._total_failures = 0
+        self._average_latency = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        """
+            Returns True if a request can be sent to the service. 
+        """
+        with self._lock:
+            if self._state == CircuitBreaker.OPEN and time.monotonic() >= self._open_until: # End of the backoff delay, let's probe the service
+                self._state = CircuitBreaker.HALF_OPEN
+                self._probing = False
+            if self._state == CircuitBreaker.HALF_OPEN:
+                if self._probing: # Only one probe request at a time
+                    return False
+                self._probing = True
+                return True
+            return self._state == CircuitBreaker.CLOSED
+
+    def record_success(self, latency):
+        """
+            Records a successful request and its latency (in seconds). 
+        """
+        with self._lock:
+            self.__record_latency(latency)
+            if self._state != CircuitBreaker.CLOSED:
+                print ("["+self._name+"] available again, circuit closed")
+            self._state = CircuitBreaker.CLOSED
+            self._failures = 0
+            self._opening_count = 0
+            self._probing = False
+
+    def record_failure(self, latency, error):
+        """
+            Records a failed request, and opens the circuit if needed. 
+        """
+        with self._lock:
+            self.__record_latency(latency)
+            self._total_failures += 1
+            self._failures += 1
+            self._probing = False
+            if self._state == CircuitBreaker.HALF_OPEN or self._failures >= self._failure_threshold:
+                self._opening_count += 1
+                backoff = min(self._base_backoff*(2**(self._opening_count-1)), self._max_backoff)
+                self._state = CircuitBreaker.OPEN
+                self._open_until = time.monotonic()+backoff
+                print ("["+self._name+"] unavailable ("+str(error)+"), next try in "+str(backoff)+" s")
+
+    @property
+    def name(self):
+        return self._name
+
+    @property
+    def state(self):
+        return self._state
+
+    @property
+    def requests(self):
+        """
+            Number of requests sent to the service. 
+        """
+        return self._requests
+
+    @property
+    def total_failures(self):
+        return self._total_failures
+
+    @property
+    def average_latency(self):
+        """
+            Exponentially weighted average latency (in seconds), None if no request yet. 
+        """
+        return self._average_latency
+
+    def __record_latency(self, latency):
+        self._requests += 1
+        if self._average_latency is None:
+            self._average_latency = latency
+        else:
+            self._average_latency += CircuitBreaker.LATENCY_SMOOTHING*(latency-self._average_latency)
+
+class GuardedRadioMetadataExtractor(AbstractRadioMetadataExtractor):
+    """
+        Health layer around a metadata extractor module. 
+        The module is only called when its circuit breaker allows it, 
+        and its exceptions are recorded as failures instead of being
+        raised to the caller (no metadata available). 
+    """
+    def __init__(self, module, name):
+        super(GuardedRadioMetadataExtractor, self).__init__(module.session)
+        self._module = module
+        self._breaker = CircuitBreaker(name)
+        self._available = False
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    def retrieve_current_metadata(self):
+        self._available = False
+        if not self._breaker.allow_request():
+            return False
+        start = time.monotonic()
+        try:
+            songFound = self._module.retrieve_current_metadata()
+        except Exception as e:
+            latency = time.monotonic()-start
+            FETCH_LATENCY.observe(latency, self._breaker.name)
+            self._breaker.record_failure(latency, e)
+            return False
+        latency = time.monotonic()-start
+        FETCH_LATENCY.observe(latency, self._breaker.name)
+        self._breaker.record_success(latency)
+        self._available = True
+        return songFound
+
+    def get_artist(self):
+        return self._module.get_artist()
+
+    def get_title(self):
+        return self._module.get_title()
+
+    def get_interpreter(self):
+        return self._module.get_interpreter()
+
+    def get_next_update_time(self):
+        if not self._available:
+            return None
+        return self._module.get_next_update_time()
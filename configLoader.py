@@ -1,5 +1,7 @@
 #!/usr/bin/env python
 from radio import Radio
+from stateStore import StateStore
+from configWatcher import ConfigWatcher
 import json
 import numbers
 
@@ -15,7 +17,12 @@ class ConfigLoader():
         This class is in charge of parsing the json configuration file, 
         checking all the parameters. It provides some getters to access
         parameters if all the parameters are following the requirements. 
+        The file can be watched, each change being loaded and checked 
+        in a new ConfigLoader object (snapshot). 
     """
+    # Parameters only used at startup (a change is applied after a restart)
+    RESTART_PARAMETERS = ("serial_device", "serial_baud_rate", "runtime", "prefetch_radio_info", "zap_mode", "library_index_path", "crossfade", "metrics_port", "metrics_address")
+
     def __init__(self, filename):
         self._filename = filename
         self._radios = []
@@ -31,13 +38,24 @@ class ConfigLoader():
         self._radio_info_check_interval = None
         self._full_radio_name_pause = None
         self._save_file_path = None
+        self._runtime = "threads"
+        self._prefetch_radio_info = False
+        self._zap_mode = False
+        self._library_index_path = "library.cache"
+        self._crossfade = 0
+        self._metrics_port = 0
+        self._metrics_address = "127.0.0.1"
         self._saved_volume = None
         self._saved_radio = 0
+        self._state_store = None
+        self._watcher = None
 
-    def parse_config_file(self):
+    def parse_config_file(self, load_cache=True):
         """
             This method parses the configuration file and 
             check that all parameters follow the prerequisites. 
+            The cached settings are also loaded, unless load_cache 
+            is False (snapshot of a reloaded file). 
         """
         with open(self._filename) as f: # Opening configuration file
             tree = json.load(f) # Parsing json content
@@ -55,6 +73,9 @@ class ConfigLoader():
             module_name = None
             if 'module_name' in radio:
                 module_name = radio['module_name']
+            fallback_urls = []
+            if 'fallback_urls' in radio: # Optional, other servers of the same stream
+                fallback_urls = radio['fallback_urls']
 
             # Check radio attributes type
             if not isinstance(long_name, str):
@@ -72,6 +93,9 @@ class ConfigLoader():
             if module_name is not None and not isinstance(module_name, str):
                 raise ConfigurationFileException("radios.radio.module_name must be a string")
 
+            if not isinstance(fallback_urls, list) or not all(isinstance(url, str) for url in fallback_urls):
+                raise ConfigurationFileException("radios.radio.fallback_urls must be a list of strings")
+
             # Check attribute value and size
             if len(long_name) > 32:
                 raise ConfigurationFileException("radios.radio.long_name must not exceed 32 characters")
@@ -83,7 +107,7 @@ class ConfigLoader():
                 raise ConfigurationFileException("radios.radio.type must be either 'stream' or 'folder'")
 
             # Register new radio
-            r = Radio(long_name, short_name, stream_url, media_type, module_name)
+            r = Radio(long_name, short_name, stream_url, media_type, module_name, fallback_urls)
             self._radios.append(r)
 
         if len(self._radios) <= 0:
@@ -102,6 +126,20 @@ class ConfigLoader():
         self._radio_info_check_interval = tree['general']['radio_info_check_interval']
         self._full_radio_name_pause = tree['general']['full_radio_name_pause']
         self._save_file_path = tree['general']['save_file_path']
+        if 'runtime' in tree['general']: # Optional, "threads" by default
+            self._runtime = tree['general']['runtime']
+        if 'prefetch_radio_info' in tree['general']: # Optional, disabled by default
+            self._prefetch_radio_info = tree['general']['prefetch_radio_info']
+        if 'zap_mode' in tree['general']: # Optional, disabled by default
+            self._zap_mode = tree['general']['zap_mode']
+        if 'library_index_path' in tree['general']: # Optional, "library.cache" by default
+            self._library_index_path = tree['general']['library_index_path']
+        if 'crossfade' in tree['general']: # Optional, 0 (gapless) by default
+            self._crossfade = tree['general']['crossfade']
+        if 'metrics_port' in tree['general']: # Optional, 0 (no metrics endpoint) by default
+            self._metrics_port = tree['general']['metrics_port']
+        if 'metrics_address' in tree['general']: # Optional, local interface only by default
+            self._metrics_address = tree['general']['metrics_address']
 
         # Check var type
         if not isinstance(self._name, str):
@@ -139,6 +177,27 @@ class ConfigLoader():
         
         if not isinstance(self._save_file_path, str):
             raise ConfigurationFileException("general.save_file_path parameter must be a string")
+
+        if not isinstance(self._runtime, str):
+            raise ConfigurationFileException("general.runtime parameter must be a string")
+
+        if not isinstance(self._prefetch_radio_info, bool):
+            raise ConfigurationFileException("general.prefetch_radio_info parameter must be a boolean")
+
+        if not isinstance(self._zap_mode, bool):
+            raise ConfigurationFileException("general.zap_mode parameter must be a boolean")
+
+        if not isinstance(self._library_index_path, str):
+            raise ConfigurationFileException("general.library_index_path parameter must be a string")
+
+        if not isinstance(self._crossfade, numbers.Number):
+            raise ConfigurationFileException("general.crossfade parameter must be a number")
+
+        if not isinstance(self._metrics_port, int) or isinstance(self._metrics_port, bool):
+            raise ConfigurationFileException("general.metrics_port parameter must be an integer")
+
+        if not isinstance(self._metrics_address, str):
+            raise ConfigurationFileException("general.metrics_address parameter must be a string")
         
         # Check var value and size
         if len(self._name) > 32:
@@ -171,41 +230,74 @@ class ConfigLoader():
         if self._full_radio_name_pause < 0:
             raise ConfigurationFileException("general.full_radio_name_pause must be a positive value (in seconds)")
 
+        if self._crossfade < 0:
+            raise ConfigurationFileException("general.crossfade must be a positive value (in seconds)")
+
+        if self._metrics_port < 0 or self._metrics_port > 65535:
+            raise ConfigurationFileException("general.metrics_port must be between 0 (disabled) and 65535")
+
+        if self._runtime != "threads" and self._runtime != "asyncio":
+            raise ConfigurationFileException("general.runtime must be either 'threads' or 'asyncio'")
+
         # Now, let's try to load cached settings if exist
-        self.load_cached_settings(self._save_file_path)
+        if load_cache:
+            self.load_cached_settings(self._save_file_path)
+
+    def watch(self, listener):
+        """
+            Watches the configuration file. At each change, the file is 
+            parsed in a new ConfigLoader object, given to the listener if 
+            all the parameters follow the prerequisites (the change is 
+            ignored otherwise). 
+        """
+        if self._watcher is None:
+            self._watcher = ConfigWatcher(self._filename, lambda: self.__reload(listener))
+            self._watcher.start()
+
+    def __reload(self, listener):
+        """
+            Loads and checks a new snapshot of the configuration file
+            (watcher thread). 
+        """
+        snapshot = ConfigLoader(self._filename)
+        try:
+            snapshot.parse_config_file(False)
+        except Exception as e: # Invalid file (being edited for example), the current configuration is kept
+            print ("Configuration file not reloaded : "+str(e))
+            return
+        print ("Configuration file reloaded")
+        for parameter in ConfigLoader.RESTART_PARAMETERS:
+            if getattr(snapshot, parameter) != getattr(self, parameter):
+                print (parameter+" changed, applied at the next restart")
+        listener(snapshot)
 
     def save_settings(self, volume, radio):
         """
             This method is called during program exit. 
-            It saves volume level and radio selection to a cache file. 
+            It saves volume level and radio selection to the cache file
+            (the other changes of the state are also written). 
             This allows restoring the program as it was before exit. 
         """
-        try:
-            f = open(self._save_file_path, "w+")
-            f.write(str(volume)+'\n') # First line is volume
-            f.write(str(radio)+'\n') # Second line is radio indice
-            f.close()
-        except:
-            pass # To not crash the program if cannot save settings
+        if self._state_store is None:
+            self._state_store = StateStore(self._save_file_path)
+        self._state_store.update(volume=volume, radio=radio)
+        self._state_store.flush()
 
     def load_cached_settings(self, file_path):
         """
             This method load the eventually previous cached settings.
             If exists, it loads volume level and radio indice from cached file.
+            The state store reading this file is kept for the next changes.
         """
-        try:
-            f = open(file_path, "r")
-            fl = f.readlines()
-            if len(fl) >= 2:
-                volume = int(fl[0])
-                radio = int(fl[1])
-                if volume >= 0 and volume <= 100:
-                    self._saved_volume = volume
-                if radio >= 0 and radio < len(self._radios):
-                    self._saved_radio = radio
-        except:
-            self._saved_volume = None
-            self._saved_radio = 0
+        self._state_store = StateStore(file_path)
+        self._saved_volume = None
+        self._saved_radio = 0
+        volume = self._state_store.get("volume")
+        radio = self._state_store.get("radio")
+        if isinstance(volume, int) and volume >= 0 and volume <= 100:
+            self._saved_volume = volume
+        if isinstance(radio, int) and radio >= 0 and radio < len(self._radios):
+            self._saved_radio = radio
 
     # Getters for all parameters
     @property
@@ -256,6 +348,57 @@ class ConfigLoader():
         """
         return self._full_radio_name_pause
     
+    @property
+    def runtime(self):
+        """
+            Getter for the runtime parameter ("threads" or "asyncio")
+        """
+        return self._runtime
+
+    @property
+    def prefetch_radio_info(self):
+        """
+            Getter for the prefetch_radio_info parameter
+        """
+        return self._prefetch_radio_info
+
+    @property
+    def zap_mode(self):
+        """
+            Getter for the zap_mode parameter
+        """
+        return self._zap_mode
+
+    @property
+    def library_index_path(self):
+        """
+            Getter for the library_index_path parameter (music library index file)
+        """
+        return self._library_index_path
+
+    @property
+    def crossfade(self):
+        """
+            Getter for the crossfade parameter (duration in seconds of the
+            transition between two songs of a folder radio, 0 for gapless)
+        """
+        return self._crossfade
+
+    @property
+    def metrics_port(self):
+        """
+            Getter for the metrics_port parameter (port of the metrics 
+            HTTP endpoint, 0 if disabled)
+        """
+        return self._metrics_port
+
+    @property
+    def metrics_address(self):
+        """
+            Getter for the metrics_address parameter (interface of the metrics endpoint)
+        """
+        return self._metrics_address
+
     @property
     def volume_step(self):
         """
@@ -304,3 +447,10 @@ class ConfigLoader():
             Returns the radio indice of the first radio to launch (0 or saved settings value)
         """
         return self._saved_radio
+
+    @property
+    def state_store(self):
+        """
+            Getter for the state store of the save_file_path file
+        """
+        return self._state_store
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+class ConfigWatcher(threading.Thread):
+    """
+        This class watches the configuration file and calls a listener
+        (without argument) when its content changes. The directory of the
+        file is watched with inotify (Linux, through ctypes), so that the
+        editors replacing the file are also detected, and the changes are
+        notified once the file is not written anymore for SETTLE_DELAY
+        seconds. If inotify is not available, the modification time of
+        the file is checked every POLL_INTERVAL seconds.
+    """
+    SETTLE_DELAY = 0.5 # Delay (in seconds) without write before reading the file
+    POLL_INTERVAL = 2 # Delay (in seconds) between two checks of the file, without inotify
+    # inotify constants (linux/inotify.h)
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct("iIII") # wd, mask, cookie, len (followed by the name)
+
+    def __init__(self, filename, listener):
+        self._filename = os.path.abspath(filename)
+        self._listener = listener
+        self._content = self.__read() # Content of the file when last notified
+        super(ConfigWatcher, self).__init__(daemon=True)
+
+    def run(self):
+        try:
+            fd = self.__open_inotify()
+        except Exception as e:
+            print ("Cannot watch the configuration file with inotify ("+str(e)+"), polling it")
+            self.__poll()
+            return
+        self.__watch(fd)
+
+    def __open_inotify(self):
+        """
+            Returns an inotify file descriptor watching the directory of the
+            file (closed writes and files moved into the directory).
+        """
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(ConfigWatcher.IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        directory = os.path.dirname(self._filename).encode()
+        if libc.inotify_add_watch(fd, directory, ConfigWatcher.IN_CLOSE_WRITE | ConfigWatcher.IN_MOVED_TO) < 0:
+            error = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(error, os.strerror(error))
+        return fd
+
+    def __watch(self, fd):
+        """
+            Waits for the inotify events of the file, then for the end of
+            the writes, and notifies the listener if the content changed.
+        """
+        name = os.path.basename(self._filename)
+        while True:
+            if name not in self.__read_events(fd):
+                continue
+            while len(select.select([fd], [], [], ConfigWatcher.SETTLE_DELAY)[0]) > 0: # Still written
+                self.__read_events(fd)
+            self.__notify()
+
+    def __read_events(self, fd):
+        """
+            Reads the pending inotify events (blocking) and returns the
+            names of the files concerned.
+        """
+        data = os.read(fd, 4096)
+        names = []
+        position = 0
+        while position+ConfigWatcher.EVENT_HEADER.size <= len(data):
+            wd, mask, cookie, length = ConfigWatcher.EVENT_HEADER.unpack_from(data, position)
+            position += ConfigWatcher.EVENT_HEADER.size
+            names.append(data[position:position+length].rstrip(b"\0").decode(errors="replace"))
+            position += length
+        return names
+
+    def __poll(self):
+        """
+            Checks the modification time (and size) of the file periodically.
+        """
+        signature = self.__get_signature()
+        while True:
+            time.sleep(ConfigWatcher.POLL_INTERVAL)
+            current = self.__get_signature()
+            if current != signature:
+                signature = current
+                time.sleep(ConfigWatcher.SETTLE_DELAY)
+                self.__notify()
+
+    def __get_signature(self):
+        try:
+            stat = os.stat(self._filename)
+            return (stat.st_mtime_ns, stat.st_size)
+        except OSError: # File being replaced
+            return None
+
+    def __read(self):
+        try:
+            with open(self._filename, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def __notify(self):
+        """
+            Calls the listener if the content of the file changed since the
+            last notification (not for a missing file).
+        """
+        content = self.__read()
+        if content is None or content == self._content:
+            return
+        self._content = content
+        try:
+            self._listener()
+        except Exception as e:
+            print (str(e))
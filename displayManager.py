@@ -1,9 +1,9 @@
 #!/usr/bin/env python
 import time
-import serial
-import unidecode
 import threading
 import queue
+import heapq
+from lcdFrameBuffer import LcdFrameBuffer
 
 class DisplayManager(threading.Thread):
     """
@@ -13,10 +13,15 @@ class DisplayManager(threading.Thread):
     VOLUME_PREFIX = "Volume "
     HALT = 1
     RADIO = 2
+    # Timer events handled by the display scheduler
+    VOLUME_TIMEOUT = 1
+    IP_TIMEOUT = 2
+    SCROLL_STEP = 3
 
     def __init__(self, lcd, name, halt_message, vol_timer, scroll_interval, scroll_pause):
         self._q = queue.Queue()
         self._lcd = lcd
+        self._frame_buffer = LcdFrameBuffer(lcd)
         self._prog_name = name
         self._halt_message = halt_message
         self._volume_timer = vol_timer
@@ -26,11 +31,11 @@ class DisplayManager(threading.Thread):
         self._radio_long_name = None
         self._volume = None
         self._radio_info = None
-        self._radio_info_length = 0
-        self._radio_info_indice = 0
-        self._volume_start_time = None
-        self._ip_start_time = None
-        self._scroll_start_time = None
+        self._scroll_frames = () # Pre-encoded frames of the second line (bytes, display duration) when the radio info must scroll
+        self._scroll_indice = 0
+        self._timers = [] # Heap of (deadline, sequence, event) entries
+        self._timer_sequence = 0
+        self._active_timers = {} # Last sequence number scheduled for each event (older entries are cancelled)
         self._mode = DisplayManager.HALT
         self._volume_displayed = False
         self._ip_displayed = False
@@ -43,12 +48,18 @@ class DisplayManager(threading.Thread):
     def run(self):
         self.__configure_lcd()
         self.__display_welcome_message()
+        self._frame_buffer.flush()
         while not self._thread_exit_flag:
-            try:
-                function, args, kwargs = self._q.get(False)
+            try: # Sleep until a command is received or the next timer is reached
+                function, args, kwargs = self._q.get(timeout=self.__get_next_timeout())
                 function(*args, **kwargs)
+                while True: # All the queued commands are rendered in a single frame
+                    function, args, kwargs = self._q.get_nowait()
+                    function(*args, **kwargs)
             except queue.Empty:
-                self.__update_display()
+                pass
+            self.__run_due_timers()
+            self._frame_buffer.flush() # Sending the changes of the screen content in one write
         self.__close()
 
     #################################################
@@ -58,15 +69,21 @@ class DisplayManager(threading.Thread):
     def terminate(self):
         self._thread_exit_flag = True
 
+    def get_queue_size(self):
+        """
+            Returns the number of commands waiting for the display thread.
+        """
+        return self._q.qsize()
+
 
     def display_volume(self, vol):
         """
             This method displays the volume on the screen, and initialize 
-            the volume timer. The update_display method will clear the 
+            the volume timer. The timer event will clear the 
             volume info at the end of the timer and set the radio name instead.
         """
         if isinstance(vol, int) and vol >= 0 and vol <= 100:
-            self._volume_start_time = time.time()
+            self.__schedule(DisplayManager.VOLUME_TIMEOUT, self._volume_timer)
             volume_text = str(vol)
             if vol == 0:
                 volume_text = "MIN"
@@ -86,14 +103,15 @@ class DisplayManager(threading.Thread):
             self._radio_short_name = short_name
             self._radio_long_name = long_name
             if self._radio_info == None: # If no info available, let's write the full name of the radio (using the two lines if needed)
+                self.__cancel(DisplayManager.SCROLL_STEP)
                 self.__set_full_text(self._radio_long_name)
             else: # If radio info is available, we have to write the radio name on the first line only (short name) and use the second line to scroll the radio info
                 self.__set_full_text(self._radio_short_name)
-                if self._radio_info_length <= 16:
+                if len(self._scroll_frames) == 0:
+                    self.__cancel(DisplayManager.SCROLL_STEP)
                     self.__update_bottom_text(self._radio_info)
                 else:
                     self.__scroll_message()
-                    self._scroll_start_time = time.time()
 
     def update_radio_info(self, message): # Only if in RADIO mode
         """
@@ -101,27 +119,47 @@ class DisplayManager(threading.Thread):
             the radio info content if no info available, or set the new text.
         """
         if message == None: # If now, no message is available (end of a song for example, or radio without info available)
-            self._radio_info_length = 0
-            self._radio_info_indice = 0
             self._radio_info = None
+            self._scroll_frames = ()
+            self._scroll_indice = 0
         elif self._mode == DisplayManager.RADIO and isinstance(message, str): # If info is available, replacing UNICODE chars by ASCII chars and stripping the string.
+            import unidecode # Imported on first use (slow import)
             self._radio_info = unidecode.unidecode(message.strip())
-            self._radio_info_length = len(self._radio_info)
-            self._radio_info_indice = 0
+            self._scroll_frames = self.__compile_scroll_frames(self._radio_info)
+            self._scroll_indice = 0
         self.update_radio(self._radio_short_name, self._radio_long_name) # Finally calls the update_radio method to really update the display (this current method only updates the text var)
     
+    def update_settings(self, name, halt_message, vol_timer, scroll_interval, scroll_pause):
+        """
+            Applies the display parameters of a reloaded configuration file.
+            The scroll steps of the current radio info are computed again
+            (the running timers keep their delay), and the program name is
+            displayed again if shown.
+        """
+        self._halt_message = halt_message
+        self._volume_timer = vol_timer
+        if scroll_interval != self._scroll_interval or scroll_pause != self._scroll_pause:
+            self._scroll_interval = scroll_interval
+            self._scroll_pause = scroll_pause
+            if self._radio_info != None: # Same text, so same number of steps (the current step is kept)
+                self._scroll_frames = self.__compile_scroll_frames(self._radio_info)
+        if name != self._prog_name:
+            self._prog_name = name
+            if self._mode == DisplayManager.HALT and not self._volume_displayed and not self._ip_displayed:
+                self.__display_welcome_message()
+    
     def display_ip_address(self, ip_address):
         """
             This method displays the IP address of the RPI
             on the screen, and initialize the ip_address_timer. 
-            The update_display method will clear the 
+            The timer event will clear the 
             ip_address at the end of the timer and set the radio name instead.
         """
         if isinstance(ip_address, str) and len(ip_address) <= 16:
             text = "Adresse IP      "+ip_address
             self.__set_full_text(text)
             self._ip_displayed = True
-            self._ip_start_time = time.time()
+            self.__schedule(DisplayManager.IP_TIMEOUT, self._volume_timer)
     
     #################################################
     ## Private functions (called by this thread)
@@ -132,6 +170,7 @@ class DisplayManager(threading.Thread):
             Properly closing the serial connection on program exiting.
         """
         self.__display_halt_message()
+        self._frame_buffer.flush()
         self._lcd.close()
     
     def __configure_lcd(self):
@@ -147,9 +186,10 @@ class DisplayManager(threading.Thread):
         self._lcd.write([0xFE, 0x50, 180]) # Set contrast
         time.sleep(0.01)
         self._lcd.write([0xFE, 0x58]) # Cleaning LCD screen
+        self._frame_buffer.reset()
         time.sleep(0.01)
         self._lcd.write([0xFE, 0x40]) # Set startup message
-        self._lcd.write(self._prog_name.encode()) # Set startup message
+        self._lcd.write(self._prog_name.encode()[:32].ljust(32)) # Set startup message (always 32 chars, else the next data is taken as the message)
         time.sleep(0.01)
 
     
@@ -168,14 +208,6 @@ class DisplayManager(threading.Thread):
         self._mode = DisplayManager.HALT
         self.__set_full_text(self._prog_name)
 
-    def __clear_lcd_screen(self):
-        """
-            To empty the LCD screen content, 
-            and set the cursor to the first character (1x1)
-        """
-        self._lcd.write([0xFE, 0x58])
-        time.sleep(0.01)
-
     def __set_full_text(self, text):
         """
             To write a text from the first character. If more than 16 chars, 
@@ -183,9 +215,7 @@ class DisplayManager(threading.Thread):
             It clears the LCD before writing. 
         """
         if isinstance(text, str):
-            self.__clear_lcd_screen()
-            self._lcd.write(text.encode())
-            time.sleep(0.01)
+            self._frame_buffer.set_full_text(text)
 
     def __update_bottom_text(self, text):
         """
@@ -193,58 +223,102 @@ class DisplayManager(threading.Thread):
             be more than 16 chars long. 
         """
         if isinstance(text, str):
-            self._lcd.write([0xFE, 0x47, 1, 2])
-            time.sleep(0.01)
-            self._lcd.write(text.encode())
-            time.sleep(0.01)
+            self._frame_buffer.set_line(1, text)
+
+    def __compile_scroll_frames(self, text):
+        """
+            Computes all the steps of the scrolling of a text on the second line 
+            (16 chars windows, already encoded) and the display duration of each 
+            step, with a pause at the beginning and at the end of the text. 
+            Returns an empty tuple if the text does not need to scroll. 
+        """
+        data = text.encode()
+        last = len(data)-16
+        if last <= 0:
+            return ()
+        frames = []
+        for i in range(last+1):
+            if i == 0 or i == last:
+                frames.append((data[i:i+16], self._scroll_pause))
+            else:
+                frames.append((data[i:i+16], self._scroll_interval))
+        return tuple(frames)
 
     def __scroll_message(self):
         """
-            This methods update the second line from one step of scrolling.
-        """
-        subtext = self._radio_info[self._radio_info_indice:min(self._radio_info_indice+16,self._radio_info_length)]
-        self.__update_bottom_text(subtext)
-        self._radio_info_indice += 1
-
-    def __update_display(self):
-        """
-            This method has two main purposes :
-              - If volume is displayed, checking timer and restoring 
-                previous display if reached
-              - If radio is displayed and radio_info available,
-                manage the scrolling of the info (one step at each call)
-        """
-        if self._ip_displayed: # If the IP is currently displayed
-            now = time.time()
-            if (now - self._ip_start_time) >= self._volume_timer: # and if the timer is reached (we have to clean the display and restore the previous content)
-                self._ip_displayed = False
-                if self._mode == DisplayManager.HALT: # If the previous content was the HALT message, let's restore it
-                    self.__display_welcome_message()
-                elif self._mode == DisplayManager.RADIO: # If it was the radio content (name + optionnaly info), restore it
-                    self._radio_info_indice = 0
-                    self.update_radio(self._radio_short_name, self._radio_long_name)
-        elif self._volume_displayed: # If the volume is currently displayed
-            now = time.time()
-            if (now - self._volume_start_time) >= self._volume_timer: # and if the timer is reached (we have to clean the display and restore the previous content)
-                self._volume_displayed = False
-                if self._mode == DisplayManager.HALT: # If the previous content was the HALT message, let's restore it
-                    self.__display_welcome_message()
-                elif self._mode == DisplayManager.RADIO: # If it was the radio content (name + optionnaly info), restore it
-                    self._radio_info_indice = 0
-                    self.update_radio(self._radio_short_name, self._radio_long_name)
-        elif self._mode == DisplayManager.RADIO: # If we are in radio mode
-            if self._radio_info != None and self._radio_info_length > 16: # And a radio info is available AND scrolling is needed (because radio info more than 16 chars)
-                now = time.time()
-                if self._radio_info_indice == 1: # If we are at the beginning of the scrolling, let's wait for a pause before starting scrolling
-                    if now - self._scroll_start_time >= self._scroll_pause:
-                        self.__scroll_message()
-                        self._scroll_start_time = time.time()
-                elif self._radio_info_indice+16 > self._radio_info_length: # The same at the end, let's make a pause before starting again the scroll from the beginning
-                    if now - self._scroll_start_time >= self._scroll_pause:
-                        self._radio_info_indice = 0
-                        self.__scroll_message()
-                        self._scroll_start_time = time.time()
-                elif now - self._scroll_start_time >= self._scroll_interval: # If in the middle of the scrolling, let's scroll of one step.
-                    self.__scroll_message()
-                    self._scroll_start_time = time.time()
+            This methods displays the current step of scrolling on the second line
+            and schedules the next step.
+        """
+        frame, duration = self._scroll_frames[self._scroll_indice]
+        self._frame_buffer.set_line(1, frame)
+        self.__schedule(DisplayManager.SCROLL_STEP, duration)
 
+    def __schedule(self, event, delay):
+        """
+            Schedules a timer event in delay seconds (monotonic clock).
+            A previously scheduled timer for the same event is cancelled.
+        """
+        self._timer_sequence += 1
+        self._active_timers[event] = self._timer_sequence
+        heapq.heappush(self._timers, (time.monotonic()+delay, self._timer_sequence, event))
+
+    def __cancel(self, event):
+        """
+            Cancels the pending timer of an event, if any.
+        """
+        self._active_timers.pop(event, None)
+
+    def __get_next_timeout(self):
+        """
+            Returns the number of seconds until the next active timer,
+            or None (blocking wait) if no timer is pending.
+        """
+        while self._timers:
+            deadline, sequence, event = self._timers[0]
+            if self._active_timers.get(event) == sequence:
+                return max(0, deadline-time.monotonic())
+            heapq.heappop(self._timers) # Cancelled or rescheduled timer, drop it
+        return None
+
+    def __run_due_timers(self):
+        """
+            Pops and handles all the timers whose deadline is reached.
+        """
+        while self._timers and self._timers[0][0] <= time.monotonic():
+            deadline, sequence, event = heapq.heappop(self._timers)
+            if self._active_timers.get(event) == sequence:
+                del self._active_timers[event]
+                self.__on_timer(event)
+
+    def __restore_display(self):
+        """
+            Restores the previous content of the screen
+            after a volume or ip address display.
+        """
+        if self._mode == DisplayManager.HALT: # If the previous content was the HALT message, let's restore it
+            self.__display_welcome_message()
+        elif self._mode == DisplayManager.RADIO: # If it was the radio content (name + optionnaly info), restore it
+            self._scroll_indice = 0
+            self.update_radio(self._radio_short_name, self._radio_long_name)
+
+    def __on_timer(self, event):
+        """
+            This method handles the timer events :
+              - Volume and ip address timeouts, which clear the
+                displayed value and restore the previous display
+              - Scroll steps of the radio info, with a pause at the
+                beginning and at the end of the text
+        """
+        if event == DisplayManager.IP_TIMEOUT:
+            self._ip_displayed = False
+            self.__restore_display()
+        elif event == DisplayManager.VOLUME_TIMEOUT:
+            self._volume_displayed = False
+            if not self._ip_displayed: # The ip address timeout will restore the display itself
+                self.__restore_display()
+        elif event == DisplayManager.SCROLL_STEP:
+            if self._ip_displayed or self._volume_displayed: # Scrolling resumes when the display is restored
+                return
+            if self._mode == DisplayManager.RADIO and self._radio_info != None and len(self._scroll_frames) > 0: # A radio info is available AND scrolling is needed (because radio info more than 16 chars)
+                self._scroll_indice = (self._scroll_indice+1) % len(self._scroll_frames) # Starting again from the beginning at the end of the text
+                self.__scroll_message()
@@ -0,0 +1,89 @@
+import json 
+import time 
+import bisect
+from radioMetadataExtrator import AbstractRadioMetadataExtractor
+
+class FranceMusiqueMetadataExtractor(AbstractRadioMetadataExtractor):
+    """
+        Metadata extractor for the France Musique webradios (livemeta API). 
+        The livemeta json file contains the timeline of the songs (start and
+        end timestamps), so the parsed timeline is kept in memory and the 
+        current song is found locally. The json file is only downloaded 
+        again when the cached timeline is exhausted (no current nor next
+        song), or too old.
+    """
+    MAX_TIMELINE_AGE = 3600 # Download the timeline again after this delay (in seconds), in case of program changes
+
+    def __init__(self, url, session=None):
+        super(FranceMusiqueMetadataExtractor, self).__init__(session)
+        self._url = url
+        self._artist = None
+        self._interpreter = None
+        self._title = None
+        self._timeline = [] # List of songs (start, end, artist, title, interpreter), sorted by start time
+        self._timeline_starts = [] # Start times of the timeline songs, for bisection
+        self._timeline_date = 0
+        self._next_update_time = None
+
+    def get_artist(self):
+        return self._artist
+
+    def get_interpreter(self):
+        return self._interpreter
+
+    def get_title(self):
+        return self._title
+
+    def get_next_update_time(self):
+        return self._next_update_time
+
+    def retrieve_current_metadata(self):
+        current_timestamp = time.time()
+        songFound = self.__find_current_song(current_timestamp)
+        exhausted = not songFound and self._next_update_time is None # No next song known either (between two songs, the start of the next one is kept)
+        if exhausted or current_timestamp - self._timeline_date > FranceMusiqueMetadataExtractor.MAX_TIMELINE_AGE: # The cached timeline is not able to answer, let's download it again
+            self.__load_timeline()
+            songFound = self.__find_current_song(current_timestamp)
+        return songFound
+
+    def __load_timeline(self):
+        """
+            Downloads and parses the json file provided by the webradio editor.
+        """
+        req = self._session.get(self._url)
+        songs = json.loads(req.text)
+        timeline = []
+        for song in songs["steps"].values(): # This json file contains a list of songs in chronological order
+            interpreter = None
+            if len(song.get("authors", "")) > 0:
+                interpreter = song["authors"]
+            elif len(song.get("performers", "")) > 0:
+                interpreter = song["performers"]
+            timeline.append((song["start"], song["end"], song.get("composers"), song.get("title"), interpreter))
+        timeline.sort(key=lambda song: song[0])
+        self._timeline = timeline
+        self._timeline_starts = [song[0] for song in timeline]
+        self._timeline_date = time.time()
+
+    def __find_current_song(self, current_timestamp):
+        """
+            Looks for the song playing at the given time in the cached timeline. 
+            Also computes the time of the next metadata change (end of 
+            the current song or start of the next one). 
+        """
+        self._artist = None
+        self._title = None
+        self._interpreter = None
+        self._next_update_time = None
+        i = bisect.bisect_right(self._timeline_starts, current_timestamp) # Index of the first song starting after now
+        if i > 0:
+            start, end, artist, title, interpreter = self._timeline[i-1]
+            if current_timestamp < end: # If now is between the start time and end time of the song, retrieve infos.
+                self._artist = artist
+                self._title = title
+                self._interpreter = interpreter
+                self._next_update_time = end
+                return True
+        if i < len(self._timeline): # No song right now, but the next one is already known
+            self._next_update_time = self._timeline[i][0]
+        return False
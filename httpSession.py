@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+class PooledHttpSession(requests.Session):
+    """
+        HTTP session shared by the metadata extractor modules. 
+        Connections are kept alive and reused between two polls
+        (no DNS + TCP + TLS setup at each request), failed requests 
+        are retried and every request gets a default timeout.
+    """
+    POOL_CONNECTIONS = 8 # Number of hosts kept in the pool
+    POOL_MAXSIZE = 2 # Max number of connections kept alive per host
+    RETRIES = 2
+    RETRY_BACKOFF = 0.5 # Seconds (doubled at each retry)
+    TIMEOUT = (5, 10) # Connect and read timeouts (in seconds)
+
+    def __init__(self):
+        super(PooledHttpSession, self).__init__()
+        retries = Retry(total=PooledHttpSession.RETRIES, backoff_factor=PooledHttpSession.RETRY_BACKOFF, status_forcelist=[500, 502, 503, 504])
+        adapter = HTTPAdapter(pool_connections=PooledHttpSession.POOL_CONNECTIONS, pool_maxsize=PooledHttpSession.POOL_MAXSIZE, max_retries=retries)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", PooledHttpSession.TIMEOUT)
+        return super(PooledHttpSession, self).request(method, url, **kwargs)
+
+_shared_session = None
+_shared_session_lock = threading.Lock()
+
+def get_shared_session():
+    """
+        Returns the HTTP session shared by all the extractor modules 
+        (created on first call).
+    """
+    global _shared_session
+    with _shared_session_lock:
+        if _shared_session is None:
+            _shared_session = PooledHttpSession()
+        return _shared_session
@@ -0,0 +1,205 @@
+import re
+import ssl
+import time
+import socket
+import http.client
+import urllib.parse
+from radioMetadataExtrator import AbstractRadioMetadataExtractor
+
+class RadioMetadataExtractor(AbstractRadioMetadataExtractor):
+    """
+        Generic metadata extractor for the Shoutcast/Icecast streams,
+        which send the current song in the stream itself (ICY metadata).
+        The stream is requested with the "Icy-MetaData" header, the audio
+        bytes before the first metadata block are skipped (not decoded)
+        while downloaded, and the connection is closed as soon as the
+        StreamTitle field is read.
+        Shoutcast v1 servers answer with an "ICY 200 OK" status line instead
+        of an HTTP one, rejected by http.client : once detected, their stream
+        is read with a raw socket instead of the HTTP session.
+    """
+    CHUNK_SIZE = 4096 # Bytes of the stream read at once
+    MAX_METADATA_BLOCKS = 2 # Empty blocks allowed before giving up (the title may only be sent after the first block)
+    MAX_METAINT = 65536 # Max number of audio bytes between two metadata blocks
+    UNSUPPORTED_RETRY_DELAY = 3600 # Delay (in seconds) before checking again a stream without ICY metadata
+    RAW_TIMEOUT = 10 # Connect and read timeout (in seconds) of the raw socket reader
+    MAX_HEADER_LINE = 8192
+    STREAM_TITLE = re.compile(r"StreamTitle='(.*?)';(?=\w+=|\s*$)", re.DOTALL)
+
+    def __init__(self, stream_url, session=None):
+        super(RadioMetadataExtractor, self).__init__(session)
+        self._url = stream_url
+        self._artist = None
+        self._interpreter = None
+        self._title = None
+        self._unsupported_until = 0
+        self._raw_stream = False # Shoutcast v1 server, read with a raw socket
+
+    def get_artist(self):
+        return self._artist
+
+    def get_interpreter(self):
+        return self._interpreter
+
+    def get_title(self):
+        return self._title
+
+    def retrieve_current_metadata(self):
+        self._artist = None
+        self._title = None
+        self._interpreter = None
+        if time.time() < self._unsupported_until: # No metadata sent by this stream
+            return False
+        if self._raw_stream:
+            stream_title = self.__read_raw_stream()
+        else:
+            try:
+                stream_title = self.__read_http_stream()
+            except Exception as e:
+                if not self.__is_icy_status_line(e):
+                    raise
+                print ("Shoutcast v1 server, reading "+self._url+" with a raw socket")
+                self._raw_stream = True
+                stream_title = self.__read_raw_stream()
+        if stream_title is None or len(stream_title) == 0: # No song (talk, advertisement...)
+            return False
+        if " - " in stream_title: # Usual "Artist - Title" format
+            self._artist, self._title = [part.strip() for part in stream_title.split(" - ", 1)]
+        else:
+            self._title = stream_title
+        return True
+
+    def __read_http_stream(self):
+        """
+            Reads the stream title with the HTTP session (None if not found).
+        """
+        req = self._session.get(self._url, headers={"Icy-MetaData": "1"}, stream=True) # Network and HTTP errors are raised to the caller
+        try:
+            req.raise_for_status()
+            metaint = self.__get_metaint(req.headers)
+            if metaint is None:
+                return None
+            return self.__read_stream_title(req.iter_content(chunk_size=RadioMetadataExtractor.CHUNK_SIZE), metaint)
+        finally:
+            req.close() # Endless body, the connection cannot be reused
+
+    def __read_raw_stream(self):
+        """
+            Reads the stream title with a raw socket (None if not found). 
+            The status line can be "ICY 200 OK" or "HTTP/1.x 200". 
+        """
+        url = urllib.parse.urlsplit(self._url)
+        port = url.port or (443 if url.scheme == "https" else 80)
+        path = url.path or "/"
+        if url.query:
+            path += "?"+url.query
+        sock = socket.create_connection((url.hostname, port), timeout=RadioMetadataExtractor.RAW_TIMEOUT)
+        try:
+            if url.scheme == "https":
+                sock = ssl.create_default_context().wrap_socket(sock, server_hostname=url.hostname)
+            request = "GET "+path+" HTTP/1.0\r\nHost: "+url.netloc+"\r\nIcy-MetaData: 1\r\nConnection: close\r\n\r\n"
+            sock.sendall(request.encode("latin-1"))
+            stream = sock.makefile("rb")
+            try:
+                status = stream.readline(RadioMetadataExtractor.MAX_HEADER_LINE).decode("latin-1").split()
+                if len(status) < 2 or not (status[0] == "ICY" or status[0].startswith("HTTP/1.")):
+                    raise IOError("Bad status line from "+self._url)
+                if status[1] != "200":
+                    raise IOError("HTTP error "+status[1]+" from "+self._url)
+                headers = {}
+                while True:
+                    line = stream.readline(RadioMetadataExtractor.MAX_HEADER_LINE)
+                    if len(line.strip()) == 0: # End of the headers (or of the stream)
+                        break
+                    name, separator, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                metaint = self.__get_metaint(headers)
+                if metaint is None:
+                    return None
+                return self.__read_stream_title(iter(lambda: stream.read1(RadioMetadataExtractor.CHUNK_SIZE), b""), metaint)
+            finally:
+                stream.close()
+        finally:
+            sock.close()
+
+    def __get_metaint(self, headers):
+        """
+            Returns the number of audio bytes between two metadata blocks, 
+            or None if the stream has no ICY metadata (not checked again 
+            before UNSUPPORTED_RETRY_DELAY). 
+        """
+        metaint = int(headers.get("icy-metaint", 0))
+        if metaint <= 0 or metaint > RadioMetadataExtractor.MAX_METAINT:
+            print ("No ICY metadata in the stream "+self._url)
+            self._unsupported_until = time.time()+RadioMetadataExtractor.UNSUPPORTED_RETRY_DELAY
+            return None
+        return metaint
+
+    def __is_icy_status_line(self, error):
+        """
+            Returns True if the error (or one of its causes) is the rejection
+            of an "ICY 200 OK" status line (Shoutcast v1 server).
+        """
+        errors = [error]
+        seen = set()
+        while len(errors) > 0:
+            error = errors.pop()
+            if id(error) in seen:
+                continue
+            seen.add(id(error))
+            if isinstance(error, http.client.BadStatusLine) and str(error.line).startswith("ICY"):
+                return True
+            causes = list(error.args)+[getattr(error, "reason", None), error.__cause__, error.__context__] # Wrapped by urllib3 and requests
+            errors.extend(cause for cause in causes if isinstance(cause, BaseException))
+        return False
+
+    def __read_stream_title(self, chunks, metaint):
+        """
+            Reads the stream (iterable of byte chunks) until a metadata block
+            containing the StreamTitle field. Each block follows metaint audio
+            bytes, and starts with its length (number of 16 bytes units). 
+            Returns None if not found.
+        """
+        skip = metaint # Audio bytes to drop before the next length byte
+        length = None # Bytes of the current metadata block still to read
+        metadata = bytearray()
+        blocks = 0
+        for chunk in chunks:
+            position = 0
+            while position < len(chunk):
+                if skip > 0: # Audio data, dropped
+                    step = min(skip, len(chunk)-position)
+                    skip -= step
+                    position += step
+                elif length is None: # Length of the metadata block
+                    length = chunk[position]*16
+                    position += 1
+                    metadata = bytearray()
+                else:
+                    step = min(length-len(metadata), len(chunk)-position)
+                    metadata += chunk[position:position+step]
+                    position += step
+                if length is not None and len(metadata) == length: # End of the metadata block
+                    blocks += 1
+                    stream_title = self.__parse_stream_title(bytes(metadata))
+                    if stream_title is not None:
+                        return stream_title
+                    if blocks >= RadioMetadataExtractor.MAX_METADATA_BLOCKS:
+                        return None
+                    skip = metaint
+                    length = None
+        return None
+
+    def __parse_stream_title(self, metadata):
+        """
+            Returns the StreamTitle field of a metadata block (None if absent).
+        """
+        metadata = metadata.rstrip(b"\0")
+        try:
+            text = metadata.decode("utf-8")
+        except UnicodeDecodeError: # Older servers send latin-1
+            text = metadata.decode("latin-1")
+        match = RadioMetadataExtractor.STREAM_TITLE.search(text)
+        if match is None:
+            return None
+        return match.group(1).strip()
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+import time
+from metrics import REGISTRY
+
+# Duration of the serial writes of the frame changes
+WRITE_TIME = REGISTRY.histogram("radiobot_lcd_write_seconds", "Duration of the serial writes to the LCD screen", buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+
+class LcdFrameBuffer():
+    """
+        Shadow frame buffer of the 2x16 serial LCD screen. 
+        Texts are written in the buffer, then the flush method compares
+        the new frame with the content currently displayed and sends 
+        only the changed characters (cursor move + characters), in 
+        one single serial write. 
+    """
+    COLUMNS = 16
+    ROWS = 2
+    BLANK = 0x20 # Space character
+    CURSOR_MOVE_SIZE = 4 # Size (in bytes) of a "set cursor position" command
+    LINE_BREAKS = (0x0D, 0x0A) # \r and \n move to the beginning of the next line
+
+    def __init__(self, lcd):
+        self._lcd = lcd
+        self._frame = self.__blank_frame() # Content to display
+        self._screen = None # Content currently displayed (None if unknown)
+
+    def reset(self):
+        """
+            To call when the LCD screen has been cleared by an 
+            external command. 
+        """
+        self._frame = self.__blank_frame()
+        self._screen = self.__blank_frame()
+
+    def clear(self):
+        """
+            Clears the frame buffer (displayed on next flush).
+        """
+        self._frame = self.__blank_frame()
+
+    def set_full_text(self, text):
+        """
+            Replaces the frame with a text written from the first character. 
+            If more than 16 chars, the end of the text is written on the 
+            second line. 
+        """
+        self.clear()
+        row = 0
+        col = 0
+        for char in text.encode():
+            if char in LcdFrameBuffer.LINE_BREAKS:
+                row += 1
+                col = 0
+            else:
+                if col >= LcdFrameBuffer.COLUMNS:
+                    row += 1
+                    col = 0
+                if row >= LcdFrameBuffer.ROWS:
+                    break
+                self._frame[row][col] = char
+                col += 1
+            if row >= LcdFrameBuffer.ROWS:
+                break
+
+    def set_line(self, row, data):
+        """
+            Replaces one line of the frame (text or encoded bytes), 
+            padded with spaces or truncated to 16 chars. 
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        data = data[:LcdFrameBuffer.COLUMNS]
+        self._frame[row][:] = data + bytes([LcdFrameBuffer.BLANK]*(LcdFrameBuffer.COLUMNS-len(data)))
+
+    def flush(self):
+        """
+            Sends the minimal set of commands to display the frame. 
+        """
+        commands = bytearray()
+        if self._screen is None: # Unknown screen content, let's start from a clean screen
+            commands += bytes([0xFE, 0x58])
+            self._screen = self.__blank_frame()
+        for row in range(LcdFrameBuffer.ROWS):
+            self.__diff_row(row, commands)
+        if len(commands) > 0:
+            start = time.monotonic()
+            self._lcd.write(bytes(commands))
+            WRITE_TIME.observe(time.monotonic()-start)
+        self._screen = [bytearray(line) for line in self._frame]
+
+    def __diff_row(self, row, commands):
+        """
+            Appends the commands updating one row of the screen. Two changed 
+            parts separated by only a few unchanged chars are sent in one 
+            write (cheaper than a new cursor move).
+        """
+        old = self._screen[row]
+        new = self._frame[row]
+        col = 0
+        while col < LcdFrameBuffer.COLUMNS:
+            if old[col] == new[col]:
+                col += 1
+                continue
+            start = col
+            last_change = col
+            col += 1
+            while col < LcdFrameBuffer.COLUMNS and col-last_change <= LcdFrameBuffer.CURSOR_MOVE_SIZE:
+                if old[col] != new[col]:
+                    last_change = col
+                col += 1
+            commands += bytes([0xFE, 0x47, start+1, row+1]) # Set cursor position (1-based column and row)
+            commands += new[start:last_change+1]
+            col = last_change+1
+
+    def __blank_frame(self):
+        return [bytearray([LcdFrameBuffer.BLANK]*LcdFrameBuffer.COLUMNS) for row in range(LcdFrameBuffer.ROWS)]
@@ -1,13 +1,13 @@
 # External imports
 import sys
 import json
-import serial
-import RPi.GPIO as GPIO
+import argparse
+import importlib
 import time
 import signal
-from netifaces import AF_INET, AF_INET6, AF_LINK, AF_PACKET, AF_BRIDGE
-import netifaces as ni
 import subprocess
+import threading
+import os
 
 # Internal modules
 from displayManager import DisplayManager
@@ -15,18 +15,29 @@ from configLoader import ConfigLoader
 from configLoader import ConfigurationFileException
 from radioManager import RadioManager
 from playerManager import PlayerManager
+from metadataPrefetcher import MetadataPrefetcher
+from musicLibrary import MusicLibrary
+from metrics import REGISTRY
 from radio import Radio
 
 ##############################
 ### GLOBAL VARS
 ##############################
 
+# Hardware (RPi.GPIO module, or virtual button bus in simulation mode)
+GPIO = None
+simulation = None
+
 # Modules
 displayManager = None
 configLoader = None
 radioManager = None
 playerManager = None
+metadataPrefetcher = None
+asyncRuntime = None
+metricsServer = None
 ip_timer = 0
+startup_timings = [] # (phase name, duration in seconds)
 
 ##############################
 ### STARTUP FUNCTIONS
@@ -57,24 +68,89 @@ def set_as_ready():
     GPIO.add_event_detect(4, GPIO.FALLING, callback=halt_callback, bouncetime=200)
 
 
+def log_startup_phase(name, start_time):
+    """
+        Records the duration of a startup phase, started at start_time (monotonic clock).
+    """
+    startup_timings.append((name, time.monotonic()-start_time))
+
+def init_player(radio):
+    """
+        Loads the player (VLC instance and alsa mixer) and starts playing
+        the given radio. Runs in a dedicated thread at startup, in parallel
+        with the LCD configuration.
+    """
+    global playerManager
+    start_time = time.monotonic()
+    try:
+        # Loading player (the music library index is loaded on first use)
+        if simulation is not None:
+            player = PlayerManager(configLoader.volume, configLoader.zap_mode, MusicLibrary(configLoader.library_index_path), configLoader.crossfade, simulation.vlc, simulation.mixer)
+        else:
+            player = PlayerManager(configLoader.volume, configLoader.zap_mode, MusicLibrary(configLoader.library_index_path), configLoader.crossfade)
+        log_startup_phase("player", start_time)
+        start_time = time.monotonic()
+        # Resuming the songs of the folders, and saving the next ones
+        player.set_resume_positions(configLoader.state_store.get("folders", {}))
+        player.set_song_listener(configLoader.state_store.set_folder_position)
+        player.change_radio(radio.stream_url, radio.media_type, radio.fallback_urls)
+        log_startup_phase("first radio", start_time)
+        playerManager = player
+    except Exception as e:
+        print ("Cannot start the player : " + str(e))
+
+def init_metrics():
+    """
+        Registers the gauges read on each collection (threads, queues, CPU)
+        and starts the metrics HTTP endpoint (Prometheus text format). 
+        The latency histograms are recorded by the modules themselves. 
+    """
+    global metricsServer
+    REGISTRY.gauge("radiobot_threads", "Number of running threads", threading.active_count)
+    REGISTRY.gauge("radiobot_display_queue_size", "Commands waiting for the display thread", displayManager.get_queue_size)
+    REGISTRY.gauge("radiobot_radio_info_queue_size", "Radio info waiting to be published", radioManager.get_queue_size)
+    REGISTRY.gauge("radiobot_command_queue_size", "UI commands waiting to be applied", radioManager.get_command_queue_size)
+    REGISTRY.gauge("process_cpu_seconds_total", "CPU time (user and system) used by the process", time.process_time, "counter")
+    REGISTRY.gauge("radiobot_load_average", "System load average over the last minute", lambda: os.getloadavg()[0])
+    try:
+        from metrics import MetricsServer # Imported only if the endpoint is enabled
+        metricsServer = MetricsServer(configLoader.metrics_address, configLoader.metrics_port)
+        metricsServer.start()
+        print ("Metrics available on http://"+configLoader.metrics_address+":"+str(configLoader.metrics_port)+"/metrics")
+    except Exception as e: # Radiobot can work without metrics
+        print ("Cannot start the metrics endpoint : " + str(e))
+
+# Configuration reload method
+def apply_config(snapshot):
+    """
+        Applies a reloaded configuration file (watcher thread) to the
+        radio manager and the display, without restarting the player.
+    """
+    radioManager.update_config(snapshot.radios, snapshot.volume_step, snapshot.radio_info_check_interval, snapshot.full_radio_name_pause)
+    displayManager.on_thread(displayManager.update_settings, snapshot.name, snapshot.halt_message, snapshot.volume_timer, snapshot.scroll_time_interval, snapshot.scroll_time_pause)
+
 # Global initialisation method
-def init_radiobot(config_file):
+def init_radiobot(config_file, simulate=False, buffering_delay=0.5, connect_delay=0):
     """
         Initialize the different radiobot components :
         - Configuration loader, which will parse the json conf file and check
           attributes conformity
+        - Player manager, which is in charge of controlling VLC and Alsa 
+          (starting and stoping network streams, applying volume modifications).
+          It is loaded in parallel with the display, and starts the last 
+          played radio as soon as possible. 
         - Display Manager, which is in charge of controling the LCD screen 
           and all the display behaviors (timers and so on)
-        - Player manager, which is in charge of controlling VLC and Alsa 
-          (starting and stoping network streams, applying volume modifications)
         - Radio manager, which is the overall manager, in charge of radio 
           selection and communication between the display and the player. 
+        In simulation mode, the GPIO buttons, the LCD screen, VLC and alsa
+        are replaced by the in-process stand-ins of the simulation module, 
+        the streams starting after the given connection and buffering delays. 
     """
-    global displayManager,configLoader,radioManager,playerManager
-    
-    # Loading GPIO configuration
-    configure_GPIO()
+    global GPIO,simulation,displayManager,configLoader,radioManager,playerManager,metadataPrefetcher,asyncRuntime
+    startup_time = time.monotonic()
 
+    start_time = time.monotonic()
     try: # Trying to load configuration file
         configLoader = ConfigLoader(config_file)
         configLoader.parse_config_file()
@@ -83,28 +159,90 @@ def init_radiobot(config_file):
         print ("Invalid configuration : " + str(e))
         print ("Exciting.")
         sys.exit(2)
+    log_startup_phase("configuration", start_time)
+
+    if simulate:
+        from simulation import Simulation
+        simulation = Simulation(configLoader.serial_baud_rate, buffering_delay=buffering_delay, connect_delay=connect_delay)
+        print ("Simulation mode (no hardware)")
+
+    # Loading player and starting the last played radio (in parallel)
+    player_thread = threading.Thread(target=init_player, args=(configLoader.radios[configLoader.radio_indice],))
+    player_thread.start()
 
     # Loading display manager
-    displayManager = DisplayManager(serial.Serial(configLoader.serial_device,configLoader.serial_baud_rate,timeout=1), configLoader.name, configLoader.halt_message, configLoader.volume_timer, configLoader.scroll_time_interval, configLoader.scroll_time_pause)
+    start_time = time.monotonic()
+    if simulation is not None:
+        lcd = simulation.lcd
+    else:
+        serial = importlib.import_module("serial")
+        lcd = serial.Serial(configLoader.serial_device,configLoader.serial_baud_rate,timeout=1)
+    displayManager = DisplayManager(lcd, configLoader.name, configLoader.halt_message, configLoader.volume_timer, configLoader.scroll_time_interval, configLoader.scroll_time_pause)
     displayManager.start()
+    log_startup_phase("display", start_time)
+
+    player_thread.join()
+    if playerManager is None:
+        print ("Exiting.")
+        sys.exit(2)
 
-    # Loading player
-    playerManager = PlayerManager(configLoader.volume)
+    # Loading the metadata prefetcher (if enabled)
+    if configLoader.prefetch_radio_info:
+        metadataPrefetcher = MetadataPrefetcher(configLoader.radios, configLoader.radio_info_check_interval)
+        metadataPrefetcher.start()
 
     # Loading the radio manager
-    radioManager = RadioManager(configLoader.radios, configLoader.volume, configLoader.volume_step, configLoader.radio_info_check_interval, configLoader.full_radio_name_pause, configLoader.radio_indice, playerManager, displayManager)
+    radioManager = RadioManager(configLoader.radios, configLoader.volume, configLoader.volume_step, configLoader.radio_info_check_interval, configLoader.full_radio_name_pause, configLoader.radio_indice, playerManager, displayManager, metadataPrefetcher, configLoader.state_store)
+
+    # Loading the metrics endpoint (if enabled)
+    if configLoader.metrics_port > 0:
+        init_metrics()
+
+    # Loading the asyncio runtime (if enabled)
+    if configLoader.runtime == "asyncio":
+        from asyncRuntime import AsyncRuntime # Imported only for this runtime (asyncio import)
+        asyncRuntime = AsyncRuntime(radioManager)
+
+    # Loading GPIO configuration (once the radio manager is able to handle the buttons)
+    start_time = time.monotonic()
+    if simulation is not None:
+        GPIO = simulation.gpio
+    else:
+        GPIO = importlib.import_module("RPi.GPIO")
+    configure_GPIO()
+    log_startup_phase("GPIO", start_time)
     
+    # Displaying the first radio (already playing)
+    radioManager.play_radio()
+
+    # Applying the next changes of the configuration file without restart
+    configLoader.watch(apply_config)
+    log_startup_phase("total", startup_time)
+    print ("Startup timings : " + ", ".join(name + " " + str(int(duration*1000)) + " ms" for name, duration in startup_timings))
+
     # Declare radiobot "ready"
     set_as_ready()
-    
-    # Starting first radio
-    radioManager.play_radio()
+
+    # Buttons of the simulation (pressed from the console)
+    if simulation is not None:
+        simulation.start_console({"+": 27, "-": 23, "n": 24, "p": 25, "h": 4})
 
 
 ##############################
 ### CALLBACK FUNCTIONS
 ##############################
 
+def dispatch(function, *args):
+    """
+        Runs a radio manager action from a GPIO callback. 
+        With the asyncio runtime, the action is forwarded to the 
+        event loop thread instead of running on the GPIO thread.
+    """
+    if asyncRuntime is not None:
+        asyncRuntime.call_threadsafe(function, *args)
+    else:
+        function(*args)
+
 def volume_up_callback(channel):
     """"
         Callback function, called when the volume UP button is pressed
@@ -112,13 +250,15 @@ def volume_up_callback(channel):
     """
     if time.time()-ip_timer < 0.4:
         try:
+            import netifaces as ni # Imported on first use
+            from netifaces import AF_INET
             ip = ni.ifaddresses('wlan0')[AF_INET][0]['addr']
             print ("IP address : "+str(ip))
             displayManager.on_thread(displayManager.display_ip_address, str(ip))
         except:
             pass # Do not generate error for this
     else:
-        radioManager.volume_up()
+        dispatch(radioManager.volume_up)
 
 def volume_down_callback(channel):
     global ip_timer
@@ -126,19 +266,19 @@ def volume_down_callback(channel):
         Callback function, called when the volume DOWN button is pressed
     """
     ip_timer = time.time()
-    radioManager.volume_down()
+    dispatch(radioManager.volume_down)
 
 def next_radio_callback(channel):
     """"
         Callback function, called when the radio NEXT button is pressed
     """
-    radioManager.next()
+    dispatch(radioManager.next)
 
 def previous_radio_callback(channel):
     """"
         Callback function, called when the radio PREVIOUS button is pressed
     """
-    radioManager.previous()
+    dispatch(radioManager.previous)
 
 def halt_callback(channel):
     """"
@@ -152,6 +292,17 @@ def halt_callback(channel):
 ### MAIN FUNCTION
 ##############################
 
+def save_folder_position():
+    """
+        Saves the position in the song currently played (folder radios), 
+        the song itself being saved when started. 
+    """
+    if playerManager is None: # Player not started
+        return
+    position = playerManager.get_folder_position()
+    if position is not None:
+        configLoader.state_store.set_folder_position(*position)
+
 def clean_exit_and_shutdown():
     """
         This function closes the program in a proper way and shutdown the rpi.
@@ -164,8 +315,12 @@ def clean_exit_and_shutdown():
     displayManager.on_thread(displayManager.terminate)
     # Saving settings
     print("Saving current settings to cache")
+    save_folder_position()
     configLoader.save_settings(radioManager.get_current_volume(), radioManager.get_current_radio_indice())
     print("Exiting.")
+    if simulation is not None: # Simulated halt, only the program is stopped (called from the button thread)
+        displayManager.join(1)
+        os._exit(0)
     subprocess.call(['sudo', 'shutdown', '-h', 'now'], shell=False)
     sys.exit(0)
 
@@ -181,6 +336,7 @@ def clean_exit():
     displayManager.on_thread(displayManager.terminate)
     # Saving settings
     print("Saving current settings to cache")
+    save_folder_position()
     configLoader.save_settings(radioManager.get_current_volume(), radioManager.get_current_radio_indice())
     print("Exiting.")
     sys.exit(0)
@@ -192,10 +348,12 @@ def sigterm_callback(signal, frame):
     clean_exit()
 
 
-def main(config_file):
+def main(config_file, simulate=False, buffering_delay=0.5, connect_delay=0):
     """
         Main method called on program startup. 
         Takes the config file path (program arguement)
+        and the simulation flag (run without hardware), with the
+        simulated stream buffering and connection delays. 
         This method run the init function and then 
         loop on refresh methods until program termination.
     """
@@ -207,20 +365,28 @@ def main(config_file):
     signal.signal(signal.SIGTERM, sigterm_callback)
 
     # Initializing radiobot 
-    init_radiobot(config_file)
+    init_radiobot(config_file, simulate, buffering_delay, connect_delay)
+
+    # With the asyncio runtime, all the periodic work is scheduled by the event loop
+    if asyncRuntime is not None:
+        try:
+            asyncRuntime.run()
+        except KeyboardInterrupt:
+            clean_exit()
 
     # While there are no process interruptions, loop on display update functions 
     try:
         while True:
-            radioManager.check_radio_info() # Check if new radio info is available, and notify display if needed
-            playerManager.update_player()
+            radioManager.check_radio_info() # Check if new radio info is available, and notify display if needed (the player supervises itself)
             time.sleep(0.05)
     except KeyboardInterrupt:
         clean_exit()
 
 if __name__== "__main__":
-    if len(sys.argv) <= 1:
-        print ("Missing configuration file path")
-        print ("Exiting.")
-        sys.exit(2)
-    main(sys.argv[1])
+    parser = argparse.ArgumentParser(description="Radiobot web radio player")
+    parser.add_argument("config_file", help="configuration file path")
+    parser.add_argument("--simulate", action="store_true", help="run without hardware (virtual buttons, LCD and player)")
+    parser.add_argument("--simulate-buffering", type=float, default=0.5, metavar="SECONDS", help="with --simulate, buffering delay of the streams and songs (default 0.5)")
+    parser.add_argument("--simulate-connect-delay", type=float, default=0, metavar="SECONDS", help="with --simulate, connection delay to the stream servers (default 0)")
+    args = parser.parse_args()
+    main(args.config_file, args.simulate, args.simulate_buffering, args.simulate_connect_delay)
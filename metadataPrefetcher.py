@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+import os
+import time
+import heapq
+import threading
+
+class MetadataPrefetcher(threading.Thread):
+    """
+        This class keeps a now-playing cache for every radio, fetching 
+        the metadata in background with a low priority thread. Radios are
+        fetched one after the other, each one at most every 
+        radio_info_check_interval seconds (or at the time its extractor 
+        module expects the metadata to change). This allows the radio 
+        manager to display the radio info immediately after a radio change. 
+    """
+    MIN_FETCH_INTERVAL = 5 # Minimum delay (in seconds) between two fetches of the same radio
+    NICENESS = 10 # Priority decrease of the prefetch thread
+
+    def __init__(self, radio_list, radio_info_check_interval):
+        self._radios = radio_list
+        self._check_interval = radio_info_check_interval
+        self._cache = {} # Radio -> (info, fetch time, next update time)
+        self._schedule = [] # Heap of (due time, position in radio_list)
+        self._schedule_version = 0 # Incremented when the schedule is rebuilt
+        self._current_radio = None
+        self._condition = threading.Condition()
+        self._thread_exit_flag = False
+        self.__schedule_first_fetches([i for i, radio in enumerate(radio_list) if self.__is_fetchable(radio)])
+        super(MetadataPrefetcher, self).__init__(daemon=True)
+
+    def run(self):
+        try: # Lower the priority of this thread only (Linux)
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), MetadataPrefetcher.NICENESS)
+        except Exception:
+            pass
+        while True:
+            with self._condition:
+                while not self._thread_exit_flag and (len(self._schedule) == 0 or self._schedule[0][0] > time.time()):
+                    timeout = None
+                    if len(self._schedule) > 0:
+                        timeout = self._schedule[0][0]-time.time()
+                    self._condition.wait(timeout)
+                if self._thread_exit_flag:
+                    return
+                due, i = heapq.heappop(self._schedule)
+                radio = self._radios[i]
+                version = self._schedule_version
+                skip = radio is self._current_radio # The radio manager already checks the current radio
+            if not skip:
+                try:
+                    infos, next_update = radio.retrieve_info()
+                    self.store(radio, infos, next_update)
+                except Exception as e:
+                    print (str(e))
+            with self._condition:
+                if version == self._schedule_version: # Not rescheduled by set_radios meanwhile
+                    heapq.heappush(self._schedule, (self.__get_next_fetch_time(radio), i))
+
+    def terminate(self):
+        with self._condition:
+            self._thread_exit_flag = True
+            self._condition.notify()
+
+    def set_radios(self, radio_list, radio_info_check_interval):
+        """
+            Replaces the list of radios (configuration file reloaded). 
+            The radios already known keep their cache and their next fetch
+            time, the new ones are fetched first. 
+        """
+        with self._condition:
+            due_times = {self._radios[i]: due for due, i in self._schedule}
+            self._radios = radio_list
+            self._check_interval = radio_info_check_interval
+            self._cache = {radio: entry for radio, entry in self._cache.items() if radio in radio_list}
+            self._schedule = []
+            self._schedule_version += 1
+            for i, radio in enumerate(radio_list):
+                if radio in due_times:
+                    heapq.heappush(self._schedule, (due_times[radio], i))
+            self.__schedule_first_fetches([i for i, radio in enumerate(radio_list) if self.__is_fetchable(radio) and radio not in due_times])
+            self._condition.notify()
+
+    def set_current_radio(self, radio):
+        """
+            Sets the radio currently played, which is not prefetched.
+        """
+        with self._condition:
+            self._current_radio = radio
+
+    def store(self, radio, infos, next_update):
+        """
+            Stores the metadata of a radio in the cache.
+        """
+        with self._condition:
+            self._cache[radio] = (infos, time.time(), next_update)
+
+    def get_cached_info(self, radio):
+        """
+            Returns the cached metadata of a radio, or None if no 
+            fresh metadata is available for this radio. 
+        """
+        with self._condition:
+            entry = self._cache.get(radio)
+        if entry is None:
+            return None
+        infos, fetch_time, next_update = entry
+        now = time.time()
+        if len(infos) == 0 or now-fetch_time > 2*self._check_interval: # No info or too old
+            return None
+        if next_update is not None and now >= next_update: # The song has changed since the fetch
+            return None
+        return infos
+
+    def __schedule_first_fetches(self, indices):
+        """
+            Schedules the first fetch of the given radios (positions in the
+            radio list), spread over the check interval. 
+        """
+        now = time.time()
+        for n, i in enumerate(indices):
+            heapq.heappush(self._schedule, (now+n*self._check_interval/len(indices), i))
+
+    def __get_next_fetch_time(self, radio):
+        now = time.time()
+        next_fetch = now+self._check_interval
+        with self._condition:
+            entry = self._cache.get(radio)
+        if entry is not None and entry[2] is not None and entry[2] < next_fetch: # Metadata will change before the next fetch
+            next_fetch = max(entry[2], now+MetadataPrefetcher.MIN_FETCH_INTERVAL)
+        return next_fetch
+
+    def __is_fetchable(self, radio):
+        """
+            Only radios with an extractor module can be prefetched
+            (vlc metadata is only available for the playing media).
+        """
+        return radio.extractor_module_name is not None and radio.extractor_module_name.lower() != "vlc"
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+import threading
+
+class Histogram():
+    """
+        Histogram metric (cumulative buckets, sum and count), 
+        with one series per set of label values. 
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, description, labels=(), buckets=DEFAULT_BUCKETS):
+        self._name = name
+        self._description = description
+        self._labels = labels
+        self._buckets = tuple(sorted(buckets))
+        self._series = {} # Label values -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """
+            Records a value (in seconds for latencies), label values given 
+            in the same order as the labels of the histogram. 
+        """
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = [[0]*len(self._buckets), 0.0, 0]
+                self._series[label_values] = series
+            for i, bound in enumerate(self._buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = ["# HELP "+self._name+" "+self._description, "# TYPE "+self._name+" histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._series.items()):
+                labels = [k+'="'+_escape(v)+'"' for k, v in zip(self._labels, label_values)]
+                for bound, bucket_count in zip(self._buckets, counts):
+                    lines.append(self._name+"_bucket{"+",".join(labels+['le="'+repr(float(bound))+'"'])+"} "+str(bucket_count))
+                lines.append(self._name+"_bucket{"+",".join(labels+['le="+Inf"'])+"} "+str(count))
+                suffix = ""
+                if len(labels) > 0:
+                    suffix = "{"+",".join(labels)+"}"
+                lines.append(self._name+"_sum"+suffix+" "+repr(total))
+                lines.append(self._name+"_count"+suffix+" "+str(count))
+        return lines
+
+class Gauge():
+    """
+        Gauge (or counter) metric, whose value is read from a callback
+        when the metrics are collected. 
+    """
+    def __init__(self, name, description, callback, metric_type="gauge"):
+        self._name = name
+        self._description = description
+        self._callback = callback
+        self._type = metric_type
+
+    def render(self):
+        try:
+            value = float(self._callback())
+        except Exception: # Value not available
+            return []
+        return ["# HELP "+self._name+" "+self._description, "# TYPE "+self._name+" "+self._type, self._name+" "+repr(value)]
+
+class MetricsRegistry():
+    """
+        Set of metrics, rendered in the Prometheus text format. 
+    """
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name, description, labels=(), buckets=Histogram.DEFAULT_BUCKETS):
+        """
+            Returns the histogram of the given name (created on first call).
+        """
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = Histogram(name, description, labels, buckets)
+            return self._metrics[name]
+
+    def gauge(self, name, description, callback, metric_type="gauge"):
+        """
+            Registers (or replaces) a gauge, read from the callback. 
+        """
+        with self._lock:
+            self._metrics[name] = Gauge(name, description, callback, metric_type)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines)+"\n"
+
+# Registry used by all the radiobot modules
+REGISTRY = MetricsRegistry()
+
+class MetricsServer(threading.Thread):
+    """
+        HTTP server exposing the metrics of a registry on /metrics
+        (Prometheus text format). 
+    """
+    def __init__(self, address, port, registry=REGISTRY):
+        from http.server import BaseHTTPRequestHandler, HTTPServer # Imported on first use (only if the endpoint is enabled)
+        from socketserver import ThreadingMixIn
+        registry_ = registry
+        class MetricsRequestHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                content = registry_.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args): # No log for each request
+                pass
+
+        class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+            daemon_threads = True
+
+        self._server = ThreadingHTTPServer((address, port), MetricsRequestHandler)
+        super(MetricsServer, self).__init__(daemon=True)
+
+    def run(self):
+        self._server.serve_forever()
+
+    def terminate(self):
+        self._server.shutdown()
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+import os
+import glob
+import json
+import fnmatch
+import threading
+import importlib
+
+mutagen = None # Optional, used to read the duration and the tags of the songs (imported on first use)
+
+class MusicLibrary():
+    """
+        Persistent index of the songs of the folder radios. 
+        For each directory, the index stores the directory mtime and the
+        files it contains (size, mtime, duration and tags). The index is
+        loaded from its json file on first use, and refreshed incrementally :
+        only the directories whose mtime changed are scanned again, and
+        only the new or modified files are read again, by a background
+        thread (the songs are available before their tags). 
+    """
+    SAVE_INTERVAL = 500 # Number of songs read by the background thread between two saves of the index
+
+    def __init__(self, index_path):
+        self._index_path = index_path
+        self._directories = None # Directory path -> {"mtime": ..., "files": {name: {"size", "mtime", "duration", "tags"}}}
+        self._lock = threading.Lock()
+        self._pending = {} # Songs whose duration and tags must be read (path -> None, a song is queued once)
+        self._reader = None # Background thread reading the pending songs
+
+    def get_tracks(self, pattern):
+        """
+            Returns the list of the songs matching a glob pattern 
+            (like glob.glob, but from the index). The duration and the
+            tags of the new songs are read afterwards, in background. 
+        """
+        with self._lock:
+            if self._directories is None:
+                self.__load()
+            directory_pattern, file_pattern = os.path.split(pattern)
+            if glob.has_magic(directory_pattern):
+                directories = [d for d in glob.glob(directory_pattern) if os.path.isdir(d)]
+            else:
+                directories = [directory_pattern]
+            changed = False
+            tracks = []
+            for directory in directories:
+                entry, updated = self.__refresh_directory(directory)
+                changed = changed or updated
+                for name, info in entry["files"].items():
+                    if fnmatch.fnmatch(name, file_pattern) and (not name.startswith('.') or file_pattern.startswith('.')): # Same behavior as glob for hidden files
+                        if "duration" not in info: # New or modified song
+                            self._pending[os.path.join(directory, name)] = None
+                        tracks.append(os.path.join(directory, name))
+            if changed:
+                self.__save()
+            if len(self._pending) > 0 and self._reader is None:
+                self._reader = threading.Thread(target=self.__read_pending_tags, daemon=True)
+                self._reader.start()
+            return tracks
+
+    def get_track_info(self, path):
+        """
+            Returns the indexed info of a song (dict with size, mtime, 
+            duration and tags) or None if not indexed. 
+        """
+        with self._lock:
+            if self._directories is None:
+                return None
+            return self.__get_info(path)
+
+    def __refresh_directory(self, directory):
+        """
+            Returns the index entry of a directory, scanned again if its 
+            mtime changed, and a flag set if the entry has been updated. 
+        """
+        path = directory or os.curdir # Pattern without directory (current directory, like glob)
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError: # Directory removed
+            return {"mtime": None, "files": {}}, self._directories.pop(directory, None) is not None
+        entry = self._directories.get(directory)
+        if entry is not None and entry["mtime"] == mtime:
+            return entry, False
+        previous_files = {}
+        if entry is not None:
+            previous_files = entry["files"]
+        files = {}
+        with os.scandir(path) as it:
+            for file_entry in it:
+                if file_entry.is_file():
+                    stat = file_entry.stat()
+                    info = previous_files.get(file_entry.name)
+                    if info is None or info["size"] != stat.st_size or info["mtime"] != stat.st_mtime: # New or modified file
+                        info = {"size": stat.st_size, "mtime": stat.st_mtime}
+                    files[file_entry.name] = info
+        entry = {"mtime": mtime, "files": files}
+        self._directories[directory] = entry
+        return entry, True
+
+    def __read_pending_tags(self):
+        """
+            Reads the duration and the tags of the pending songs (background
+            thread), the index being saved regularly and at the end. 
+        """
+        count = 0
+        while True:
+            with self._lock:
+                if len(self._pending) == 0 or count >= MusicLibrary.SAVE_INTERVAL:
+                    self.__save()
+                    count = 0
+                if len(self._pending) == 0:
+                    self._reader = None
+                    return
+                path, _ = self._pending.popitem()
+                info = self.__get_info(path)
+                if info is None or "duration" in info: # Removed, or already read
+                    continue
+                size, mtime = info["size"], info["mtime"]
+            tags = {"size": size, "mtime": mtime}
+            self.__read_tags(path, tags) # Slow file access, without the lock
+            with self._lock:
+                info = self.__get_info(path)
+                if info is not None and info["size"] == size and info["mtime"] == mtime: # Not modified meanwhile
+                    info.update(tags)
+                    count += 1
+
+    def __get_info(self, path):
+        entry = self._directories.get(os.path.dirname(path))
+        if entry is None:
+            return None
+        return entry["files"].get(os.path.basename(path))
+
+    def __read_tags(self, path, info):
+        """
+            Reads the duration (seconds) and the tags of a song, if mutagen is available.
+        """
+        global mutagen
+        info["duration"] = None
+        info["tags"] = {}
+        if mutagen is None:
+            try:
+                mutagen = importlib.import_module("mutagen")
+            except ImportError:
+                return
+        try:
+            song = mutagen.File(path, easy=True)
+            if song is not None:
+                if song.info is not None:
+                    info["duration"] = song.info.length
+                if song.tags is not None:
+                    for tag in ("artist", "title", "album"):
+                        if tag in song.tags and len(song.tags[tag]) > 0:
+                            info["tags"][tag] = str(song.tags[tag][0])
+        except Exception as e: # Unreadable file, indexed without tags
+            print (str(e))
+
+    def __load(self):
+        """
+            Loads the index file (empty index if not available).
+        """
+        self._directories = {}
+        try:
+            with open(self._index_path) as f:
+                self._directories = json.load(f)
+        except Exception:
+            pass
+
+    def __save(self):
+        """
+            Writes the index file (written in a temporary file, then renamed, 
+            so that the index is never corrupted).
+        """
+        try:
+            temp_path = self._index_path+".tmp"
+            with open(temp_path, "w") as f:
+                json.dump(self._directories, f)
+            os.replace(temp_path, self._index_path)
+        except Exception as e:
+            print (str(e))
@@ -1,65 +1,293 @@
 #!/usr/bin/env python
-import vlc
-from subprocess import call
+from alsaMixer import AlsaMixer
+from metrics import REGISTRY
+from streamHealthMonitor import StreamHealthMonitor
+import importlib
 import glob
 import random
 import time
 import threading
+import queue
+
+vlc = None # python-vlc module, imported on first use by init_vlc (slow import)
+
+# Delay between a radio change and the first audio of the new radio
+SWITCH_LATENCY = REGISTRY.histogram("radiobot_station_switch_seconds", "Delay between a radio change and the first audio", ("source",))
 
 class PlayerManager():
     """
         This module is managing the VLC program the alsaaudio mixer for
         volume control. 
+        The players are supervised with the libVLC events (playing, end
+        reached, error, buffering, metadata changes), handled one by one
+        by a dedicated thread, which also sleeps until the next timed
+        action (end of a song, crossfade step, reconnection).
+        Network streams are watched by a health monitor (VLC statistics),
+        and reconnected with a backoff delay when lost or stalled, trying
+        the fallback URLs of the radio in turn.
+        In zap mode, muted standby players keep the streams of the adjacent
+        radios buffered, so that a radio change only swaps players. 
+        In folder mode, the next song is preloaded while the current one
+        is playing, and started on a second player at the end of the 
+        current song (gapless, or with a crossfade). 
+        The player backend (python-vlc module by default) and the volume
+        mixer (alsa "Digital" control by default) can be replaced, by the
+        simulation stand-ins for example. 
     """
-    def __init__(self, volume):
+    SUPERVISION_INTERVAL = 1 # Delay (in seconds) between two checks of a song whose length is not known yet
+    MIN_UPDATE_DELAY = 0.05
+    GAPLESS_LEAD = 0.1 # Delay (in seconds) before the end of a song to start the next one (without crossfade)
+    END_MARGIN = 1 # Delay (in seconds) after the expected end of the previous song to stop it, if its end was not notified
+    FADE_STEP = 0.1 # Delay (in seconds) between two volume updates during a crossfade
+    RESTART_DELAY = 1 # Min delay (in seconds) between two starts of a song, after an error
+    # Player events (libVLC events, and wake up of the supervision thread)
+    WAKE = 0
+    PLAYING = 1
+    END_REACHED = 2
+    ERROR = 3
+    BUFFERING = 4
+    META_CHANGED = 5
+
+    def __init__(self, volume, zap_mode=False, music_library=None, crossfade=0, backend=None, mixer=None):
         self._volume = volume
+        self._vlc = backend
+        self._crossfade = crossfade
+        self._music_library = music_library
+        self._zap_mode = zap_mode
+        self._standby = {} # Stream URL -> (player, media) of the standby players
+        self._url = None
+        self._stream_urls = [] # URL and fallback URLs of the current stream
+        self._stream_indice = 0 # Indice of the URL currently played in _stream_urls
+        self._health = StreamHealthMonitor()
         self._player = None
         self._instance = None
         self._media = None
         self._library = None
         self._library_iterator = None
+        self._song = None
+        self._next_song = None
+        self._next_media = None
+        self._other_player = None # Second player, for the next song or the previous song fading out (or ending)
+        self._fade_start = None
+        self._previous_end = None # Time at which the previous song is stopped (gapless transition), if still playing
+        self._switch_start = None # Radio change time (monotonic clock) until the first audio, with the source of the radio
+        self._switch_source = None
+        self._recover_time = None # Time of the reconnection of the stream (or of the next song) after an error
+        self._info_listener = None
+        self._infos_changed = False
+        self._song_listener = None
+        self._resume_positions = {} # Folder URL -> (song, position in seconds) to resume
+        self._events = queue.Queue() # Player events (event, source, value), from the libVLC threads
         self._timer = 0
-        self._lock = threading.Lock()
+        self._lock = threading.RLock()
+        self._mixer = mixer
         self.init_vlc()
         self.init_alsa()
+        threading.Thread(target=self.__supervise, daemon=True).start()
 
     def init_vlc(self):
         """
             Creates a vlc instance, ready to listen for an audio stream.
         """
-        self._instance = vlc.Instance("--no-video --aout=alsa --no-metadata-network-access")
-        self._player = self._instance.media_player_new()
+        global vlc
+        if self._vlc is None:
+            if vlc is None:
+                vlc = importlib.import_module("vlc")
+            self._vlc = vlc
+        self._instance = self._vlc.Instance("--no-video --aout=alsa --no-metadata-network-access")
+        self._player = self.__new_player()
         self._player.audio_set_volume(self._volume)
 
     def init_alsa(self):
         """
-            Alsa calls are direct system calls. 
-            The init_alsa method purpose is to set the 
-            pre-defined volume on the alsa mixer
+            Opens the "Digital" alsa mixer control (kept open), if no
+            other mixer is given, and sets the pre-defined volume on it. 
+        """
+        if self._mixer is None:
+            self._mixer = AlsaMixer("Digital")
+        self._mixer.set_volume(self._volume)
+
+    def set_info_listener(self, listener):
+        """
+            Registers a function called with the new info (string) each time
+            the metadata of the playing media changes (new song of a folder,
+            or new title announced by a stream).
         """
-        call(["amixer", "-M", "-q", "set", "Digital", str(self._volume)+"%"])
+        self._info_listener = listener
 
-    def change_radio(self, url, media_type):
+    def set_song_listener(self, listener):
+        """
+            Registers a function called with the folder URL and the song
+            path each time a new song of a folder is started. 
+        """
+        self._song_listener = listener
+
+    def set_resume_positions(self, positions):
+        """
+            Takes the songs to resume in the folders (folder URL -> (song,
+            position in seconds)), used the next time each folder is played. 
+        """
+        with self._lock:
+            self._resume_positions = dict(positions)
+
+    def get_folder_position(self):
+        """
+            Returns the folder URL, the song played and the position in this
+            song (in seconds), or None if no folder is played. 
+        """
+        with self._lock:
+            if self._library_iterator is None or self._song is None:
+                return None
+            return self._url, self._song, max(self._player.get_time(), 0)/1000
+
+    def change_radio(self, url, media_type, fallback_urls=()):
         """
             Takes a stream URL in input and asks the vlc instance to 
             listen for this stream and play its content. 
+            The fallback URLs (same stream, other servers) are played in 
+            turn if the stream is lost. 
             Run the init_vlc method if no vlc instance available. 
+            Nothing is done if this radio is already played. 
         """
+        with self._lock:
+            self.__change_radio(url, media_type, fallback_urls)
+        self._events.put((PlayerManager.WAKE, None, None))
+
+    def __change_radio(self, url, media_type, fallback_urls):
         if self._player is None:
             self.init_vlc()
         else:
+            if url == self._url and (self._library_iterator is not None or media_type == "stream"): # Already played (started during startup for example)
+                if media_type == "stream" and self._stream_urls[1:] != list(fallback_urls): # Fallback URLs changed (configuration reloaded)
+                    played = self.__get_stream_url()
+                    self._stream_urls = [url]+list(fallback_urls)
+                    self._stream_indice = self._stream_urls.index(played) if played in self._stream_urls else 0
+                return
+            if media_type == "stream" and url in self._standby: # Zap mode, the stream is already buffered by a standby player
+                self.__swap_player(url, fallback_urls)
+                return
             if self._player.is_playing():
                 self._player.stop()
-            self._library_iterator = None
+            self.__stop_folder_playback()
 
-        if media_type == "stream":
-            self._media = self._instance.media_new(url)
-            self._timer = time.time()
+        self._url = url
+        self._switch_start = time.monotonic()
+        self._switch_source = media_type
+        self._recover_time = None
+        if media_type == "stream": # Starting the stream immediately
+            self._stream_urls = [url]+list(fallback_urls)
+            self._stream_indice = 0
+            self._health.forget_failures()
+            self.__connect_stream()
         elif media_type == "folder":
-            self._library = glob.glob(url)
+            self._stream_urls = []
+            if self._music_library is not None: # Songs listed from the persistent index
+                self._library = self._music_library.get_tracks(url)
+            else:
+                self._library = glob.glob(url)
             random.shuffle(self._library)
+            resume = self._resume_positions.pop(url, None)
+            if resume is not None and resume[0] in self._library: # Song played before the exit first
+                self._library.remove(resume[0])
+                self._library.insert(0, resume[0])
             self._library_iterator = iter(self._library)
-            self._timer = time.time()
+            self.__preload_next_song()
+            if resume is not None and self._next_song == resume[0] and resume[1] > 0:
+                self._next_media.add_option("start-time="+str(resume[1])) # Resuming at the saved position
+            self.__start_next_song(False) # Starting the first song immediately
+
+    def set_standby_radios(self, radios):
+        """
+            Zap mode only. Takes a list of (url, media_type) of the radios
+            which may be played next, starts a muted standby player for each
+            stream and releases the standby players not needed anymore. 
+        """
+        if not self._zap_mode or self._instance is None:
+            return
+        with self._lock:
+            urls = [url for url, media_type in radios if media_type == "stream" and url != self._url]
+            for url in list(self._standby):
+                if url not in urls:
+                    player, media = self._standby.pop(url)
+                    player.stop()
+                    player.release()
+            for url in urls:
+                if url not in self._standby:
+                    player = self.__new_player()
+                    media = self.__new_media(url)
+                    player.set_media(media)
+                    self.__mute(player)
+                    player.play()
+                    self._standby[url] = (player, media)
+
+    def __swap_player(self, url, fallback_urls):
+        """
+            Replaces the current player by the standby player of the
+            given stream. The current player becomes a standby player
+            if it is playing a stream, or is released. The standby
+            stream is connected again if it is not playing.
+        """
+        player, media = self._standby.pop(url)
+        if self._library_iterator is None and self._url is not None: # Keep the current stream buffered, it may be played again
+            self.__mute(self._player)
+            self._standby[self._url] = (self._player, self._media)
+        else:
+            self._player.stop()
+            self._player.release()
+            self.__stop_folder_playback()
+        self._player = player
+        self._media = media
+        self._url = url
+        self._stream_urls = [url]+list(fallback_urls)
+        self._stream_indice = 0
+        self._player.audio_set_mute(False)
+        self._player.audio_set_volume(self._volume)
+        self._timer = time.time()
+        self._recover_time = None
+        self._health.forget_failures()
+        self._health.reset()
+        self._switch_start = time.monotonic()
+        self._switch_source = "standby"
+        if self._player.is_playing(): # Already buffered, the playing event was received by the standby player
+            self._health.on_playing()
+            self.__on_first_audio()
+        else: # Standby players are not supervised, the stream may be lost or still opening : connecting it again now
+            self.__connect_stream()
+        self._infos_changed = True
+
+    def __mute(self, player):
+        player.audio_set_mute(True)
+        player.audio_set_volume(0)
+
+    def __new_player(self):
+        """
+            Creates a media player and subscribes to its events.
+        """
+        player = self._instance.media_player_new()
+        event_manager = player.event_manager()
+        event_manager.event_attach(self._vlc.EventType.MediaPlayerPlaying, self.__on_vlc_event, PlayerManager.PLAYING, player)
+        event_manager.event_attach(self._vlc.EventType.MediaPlayerEndReached, self.__on_vlc_event, PlayerManager.END_REACHED, player)
+        event_manager.event_attach(self._vlc.EventType.MediaPlayerEncounteredError, self.__on_vlc_event, PlayerManager.ERROR, player)
+        event_manager.event_attach(self._vlc.EventType.MediaPlayerBuffering, self.__on_vlc_event, PlayerManager.BUFFERING, player)
+        return player
+
+    def __new_media(self, mrl):
+        """
+            Creates a media and subscribes to its metadata changes.
+        """
+        media = self._instance.media_new(mrl)
+        media.event_manager().event_attach(self._vlc.EventType.MediaMetaChanged, self.__on_vlc_event, PlayerManager.META_CHANGED, media)
+        return media
+
+    def __on_vlc_event(self, event, kind, source):
+        """
+            libVLC event callback (called by a libVLC thread, which must not
+            call the player back), the event is queued for the supervision thread.
+        """
+        value = None
+        if kind == PlayerManager.BUFFERING:
+            value = event.u.new_cache
+        self._events.put((kind, source, value))
 
     def change_volume(self, volume):
         """
@@ -68,40 +296,295 @@ class PlayerManager():
               - VLC volume setting
               - General ALSA mixer for RCA output
         """
-        self._volume = volume
-        if self._player is None:
-            self.init_vlc()
-        self._player.audio_set_volume(self._volume)
-        call(["amixer", "-M", "-q", "set", "Digital", str(self._volume)+"%"])
+        with self._lock:
+            self._volume = volume
+            if self._player is None:
+                self.init_vlc()
+            self._player.audio_set_volume(self._volume)
+        self._mixer.set_volume(self._volume)
 
-    def update_player(self):
-        if self._player is not None and not self._player.is_playing() and time.time()-self._timer > 1: # For every cases
-            if self._library_iterator is not None: # It is folder media type
+    def __supervise(self):
+        """
+            Supervision thread : handles the player events, and wakes up for
+            the timed actions of the players (see __get_update_delay).
+        """
+        while True:
+            with self._lock:
+                timeout = self.__get_update_delay()
+            try:
+                event = self._events.get(timeout=timeout)
+            except queue.Empty:
+                event = None
+            with self._lock:
                 try:
-                    # Start next song
-                    song = next(self._library_iterator)
-                    print ("Song : "+song)
-                    self._media = self._instance.media_new(str(song))
-                    self._player.set_media(self._media)
-                    self._player.play()
-                    self._timer = time.time()
-                except StopIteration:
-                    random.shuffle(self._library)
-                    self._library_iterator = iter(self._library)
-            else: # It is network stream
-                self._player.set_media(self._media)
-                self._player.play()
-                self._timer = time.time()
-                print ("Starting playing")
+                    if event is not None:
+                        self.__handle_event(*event)
+                    self.__update_player()
+                except Exception as e:
+                    print (str(e))
+                infos_changed = self._infos_changed
+                self._infos_changed = False
+            if infos_changed and self._info_listener is not None:
+                self._info_listener(self.get_infos())
+
+    def __handle_event(self, kind, source, value):
+        """
+            Handles a player event. Only the events of the current player
+            (or of its media) and the end of the previous song are handled,
+            the standby players and the previous song of a crossfade are
+            not supervised.
+        """
+        if kind == PlayerManager.META_CHANGED:
+            if source is self._media:
+                self._infos_changed = True
+            return
+        if self._previous_end is not None and source is self._other_player and (kind == PlayerManager.END_REACHED or kind == PlayerManager.ERROR): # End of the previous song (gapless transition)
+            self.__stop_previous_song()
+            return
+        if kind == PlayerManager.WAKE or source is not self._player:
+            return
+        if kind == PlayerManager.PLAYING:
+            self._health.on_playing()
+            if self._switch_start is not None:
+                self.__on_first_audio()
+        elif kind == PlayerManager.BUFFERING:
+            self._health.on_buffering(value)
+        elif kind == PlayerManager.END_REACHED or kind == PlayerManager.ERROR:
+            if kind == PlayerManager.ERROR:
+                print ("Player error on "+str(self.__get_stream_url()))
+            if self._library_iterator is not None:
+                if kind == PlayerManager.END_REACHED and self._fade_start is None: # End of the song, next one immediately
+                    self.__start_next_song(False)
+                else: # Broken song, skipped after a delay
+                    self._recover_time = max(time.time(), self._timer+PlayerManager.RESTART_DELAY)
+            elif self._recover_time is None: # Stream lost
+                self.__schedule_reconnection()
+
+    def __on_first_audio(self):
+        SWITCH_LATENCY.observe(time.monotonic()-self._switch_start, self._switch_source)
+        self._switch_start = None
+
+    def __update_player(self):
+        """
+            Runs the timed actions of the players : crossfade steps, start
+            of the next song, restart of a lost or stalled stream.
+        """
+        if self._player is None:
+            return
+        now = time.time()
+        if self._recover_time is not None:
+            if now >= self._recover_time:
+                self._recover_time = None
+                if self._library_iterator is not None:
+                    self.__start_next_song(False)
+                else:
+                    self.__connect_stream()
+        elif self._library_iterator is None: # It is network stream
+            if self._media is not None and self._health.check(self.__get_stream_stats()):
+                print ("Stream stalled")
+                self.__schedule_reconnection()
+        else: # It is folder media type
+            if self._previous_end is not None and now >= self._previous_end: # End of the previous song not notified
+                self.__stop_previous_song()
+            if self._fade_start is not None:
+                self.__update_crossfade()
+            if self._fade_start is None and self._player.is_playing():
+                remaining = self.__get_remaining_time()
+                if remaining is not None and remaining <= max(self._crossfade, PlayerManager.GAPLESS_LEAD) and now-self._timer > 1: # End of the song, starting the next one
+                    self.__start_next_song(self._crossfade > 0, remaining)
+
+    def __get_update_delay(self):
+        """
+            Returns the number of seconds before the next timed action
+            of the players, or None if there is nothing to do until
+            the next player event.
+        """
+        delays = []
+        if self._player is not None:
+            if self._recover_time is not None:
+                delays.append(self._recover_time-time.time())
+            elif self._library_iterator is None and self._media is not None: # Stream health check
+                delays.append(StreamHealthMonitor.CHECK_INTERVAL)
+            if self._previous_end is not None: # Previous song still playing
+                delays.append(self._previous_end-time.time())
+            if self._fade_start is not None: # Crossfade in progress
+                delays.append(PlayerManager.FADE_STEP)
+            elif self._library_iterator is not None and self._player.is_playing(): # Wake up at the end of the current song
+                remaining = self.__get_remaining_time()
+                if remaining is None: # Length not known yet
+                    delays.append(PlayerManager.SUPERVISION_INTERVAL)
+                else:
+                    delays.append(max(remaining-max(self._crossfade, PlayerManager.GAPLESS_LEAD), self._timer+1-time.time()))
+        if len(delays) == 0:
+            return None
+        return max(min(delays), PlayerManager.MIN_UPDATE_DELAY)
+
+    def __get_stream_url(self):
+        """
+            Returns the URL currently played (stream) or the radio URL.
+        """
+        if len(self._stream_urls) > 0:
+            return self._stream_urls[self._stream_indice]
+        return self._url
+
+    def __connect_stream(self):
+        """
+            Plays the current URL of the stream on the current player.
+        """
+        url = self._stream_urls[self._stream_indice]
+        self._media = self.__new_media(url)
+        self._player.set_media(self._media)
+        self._player.play()
+        self._timer = time.time()
+        self._health.reset()
+        print ("Starting playing "+url)
+
+    def __schedule_reconnection(self):
+        """
+            Stops the lost or stalled stream, and schedules the connection
+            to the next URL of the radio after the backoff delay.
+        """
+        delay = self._health.record_failure(len(self._stream_urls))
+        self._player.stop()
+        if len(self._stream_urls) > 1:
+            self._stream_indice = (self._stream_indice+1) % len(self._stream_urls)
+        self._recover_time = time.time()+delay
+        print ("Reconnecting in "+str(delay)+" s to "+self._stream_urls[self._stream_indice])
+
+    def __get_stream_stats(self):
+        """
+            Returns the (input, demuxer) numbers of bytes read from the 
+            stream, or None if the statistics are not available.
+        """
+        try:
+            stats = self._vlc.MediaStats()
+            if not self._media.get_stats(stats):
+                return None
+            return (stats.read_bytes, stats.demux_read_bytes)
+        except AttributeError: # Statistics not provided by this libVLC version
+            return None
+
+    def __get_remaining_time(self):
+        """
+            Returns the remaining time (in seconds) of the current song, 
+            or None if unknown. 
+        """
+        length = self._player.get_length()
+        if length <= 0:
+            return None
+        return (length-self._player.get_time())/1000
 
+    def __preload_next_song(self):
+        """
+            Picks the next song of the library and parses it in background, 
+            so that it is ready to be played at the end of the current song. 
+        """
+        self._next_song = None
+        self._next_media = None
+        for attempt in range(2):
+            try:
+                self._next_song = next(self._library_iterator)
+                break
+            except StopIteration: # End of the library, shuffling it again
+                random.shuffle(self._library)
+                self._library_iterator = iter(self._library)
+        if self._next_song is None: # Empty library
+            return
+        self._next_media = self.__new_media(str(self._next_song))
+        try:
+            self._next_media.parse_with_options(self._vlc.MediaParseFlag.local, 0) # Asynchronous parsing
+        except AttributeError: # libvlc < 3
+            self._next_media.parse_async()
+
+    def __start_next_song(self, fade, remaining=None):
+        """
+            Starts the preloaded song on the second player and swaps the players.
+            The previous song is faded out if fade is set, played until its
+            end if its remaining time (seconds) is given (gapless), or stopped. 
+        """
+        if self._next_media is None:
+            self.__preload_next_song()
+            if self._next_media is None:
+                return
+        if self._previous_end is not None: # The second player is needed
+            self.__stop_previous_song()
+        if self._other_player is None:
+            self._other_player = self.__new_player()
+        next_player = self._other_player
+        next_player.set_media(self._next_media)
+        if fade:
+            next_player.audio_set_volume(0)
+        else:
+            next_player.audio_set_volume(self._volume)
+        next_player.play()
+        previous_player = self._player
+        self._player = next_player
+        self._other_player = previous_player
+        self._media = self._next_media
+        self._song = self._next_song
+        print ("Song : "+self._song)
+        if self._song_listener is not None:
+            self._song_listener(self._url, self._song)
+        self._timer = time.time()
+        self._infos_changed = True
+        if fade:
+            self._fade_start = time.time()
+        elif remaining is not None: # Stopped on its end event
+            self._previous_end = time.time()+remaining+PlayerManager.END_MARGIN
+        else:
+            previous_player.stop()
+        self.__preload_next_song()
+
+    def __stop_previous_song(self):
+        self._other_player.stop()
+        self._previous_end = None
+
+    def __update_crossfade(self):
+        """
+            Updates the volumes of the two players during a crossfade, 
+            and stops the previous song at the end of the crossfade. 
+        """
+        ratio = (time.time()-self._fade_start)/self._crossfade
+        if ratio >= 1:
+            self._other_player.stop()
+            self._player.audio_set_volume(self._volume)
+            self._fade_start = None
+        else:
+            self._player.audio_set_volume(int(self._volume*ratio))
+            self._other_player.audio_set_volume(int(self._volume*(1-ratio)))
+
+    def __stop_folder_playback(self):
+        """
+            Stops the second player and forgets the preloaded song. 
+        """
+        if self._other_player is not None:
+            self._other_player.stop()
+        self._fade_start = None
+        self._previous_end = None
+        self._next_song = None
+        self._next_media = None
+        self._library_iterator = None
 
     def get_infos(self):
         self._lock.acquire()
         info = ""
         try:
-            title = str(self._media.get_meta(vlc.Meta.Title))
-            artist = str(self._media.get_meta(vlc.Meta.Artist))
-            info = artist+" - "+title
+            tags = {}
+            if self._library_iterator is not None and self._music_library is not None and self._song is not None: # Tags may be available in the music library index
+                track = self._music_library.get_track_info(self._song)
+                if track is not None:
+                    tags = track.get("tags", {})
+            now_playing = None
+            if self._library_iterator is None: # Title announced by the stream (ICY metadata)
+                now_playing = self._media.get_meta(self._vlc.Meta.NowPlaying)
+            if "title" in tags:
+                info = tags.get("artist", "")+" - "+tags["title"]
+            elif now_playing:
+                info = str(now_playing)
+            else:
+                title = str(self._media.get_meta(self._vlc.Meta.Title))
+                artist = str(self._media.get_meta(self._vlc.Meta.Artist))
+                info = artist+" - "+title
             print ("["+threading.currentThread().getName()+"]  Getting info :-)")
         except Exception as e:
             print (str(e))
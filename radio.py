@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import importlib
+import threading
 
 class Radio():
     """
@@ -7,16 +8,22 @@ class Radio():
           - A long name (when no infos are available)
           - A short name (when radio info is displayed on the second line)
           - A stream URL
-          - The name of the extractor module (optional)
+          - The name of the extractor module (optional). "vlc" reads the
+            metadata from the player, and "icy" from the stream itself
+            (Shoutcast/Icecast metadata, see icyMetadataModule). 
+          - Fallback URLs of the stream (optional), played if the stream is lost
     """
+    ICY_MODULE = "icy"
 
-    def __init__(self, long_name, short_name, stream_url, media_type, extractor_module):
+    def __init__(self, long_name, short_name, stream_url, media_type, extractor_module, fallback_urls=()):
         self._long_name = long_name
         self._short_name = short_name
         self._stream_url = stream_url
         self._media_type = media_type
         self._extractor_module_name = extractor_module
+        self._fallback_urls = tuple(fallback_urls)
         self._extractor_module = None
+        self._lock = threading.Lock() # Extractor modules are not thread safe
 
     @property
     def long_name(self):
@@ -30,6 +37,10 @@ class Radio():
     def stream_url(self):
         return self._stream_url
 
+    @property
+    def fallback_urls(self):
+        return self._fallback_urls
+
     @property
     def media_type(self):
         return self._media_type
@@ -38,12 +49,65 @@ class Radio():
     def extractor_module_name(self):
         return self._extractor_module_name
 
+    @property
+    def settings(self):
+        """
+            Returns all the configuration attributes of the radio (tuple), 
+            to compare two radios loaded from the configuration file. 
+        """
+        return (self._long_name, self._short_name, self._stream_url, self._media_type, self._extractor_module_name, self._fallback_urls)
+
     def get_module(self):
         if self._extractor_module is None and self._extractor_module_name is not None and self._extractor_module_name.lower() != "vlc" :
             try: # Trying to load the python module dinamically from the module name
-                lib = importlib.import_module(self.extractor_module_name)
-                self._extractor_module = lib.RadioMetadataExtractor()
+                if self._extractor_module_name.lower() == Radio.ICY_MODULE: # Generic module, reading the metadata of the stream URL
+                    lib = importlib.import_module("icyMetadataModule")
+                    module = lib.RadioMetadataExtractor(self._stream_url)
+                else:
+                    lib = importlib.import_module(self.extractor_module_name)
+                    module = lib.RadioMetadataExtractor()
+                from circuitBreaker import GuardedRadioMetadataExtractor
+                self._extractor_module = GuardedRadioMetadataExtractor(module, self.extractor_module_name) # Module protected by a circuit breaker
             except Exception as e: # If cannot load the module, better not to stop the program and just display no info. 
                 print (e)
                 self._extractor_module = None
         return self._extractor_module # None if no module available or the RadioExtractorModule object. 
+
+    def retrieve_info(self):
+        """
+            Fetches the current metadata with the extractor module of this radio.
+            Returns a tuple (info, next_update_time), where info is the
+            metadata as a single string (empty string if no info available)
+            and next_update_time the time at which the metadata is expected
+            to change (None if unknown). 
+            This method is blocking (network access).
+        """
+        infos = ""
+        next_update = None
+        module = self.get_module() # Get the module related to this radio
+        if module is not None: # If a module is available
+            with self._lock:
+                if module.retrieve_current_metadata(): # If metadata are available at this time
+                    artist = module.get_artist()
+                    title = module.get_title()
+                    interpreter = module.get_interpreter()
+                    if not isinstance(artist, str):
+                        artist = ""
+
+                    if not isinstance(title, str):
+                        title = ""
+
+                    if not isinstance(interpreter, str):
+                        interpreter = ""
+
+                    infos = artist
+                    if len(artist) > 0 and (len(title) > 0 or len(interpreter) > 0):
+                        infos += " - "
+
+                    infos += title
+                    if len(title) > 0 and len(interpreter) > 0:
+                        infos += " - "
+
+                    infos += interpreter
+                next_update = module.get_next_update_time()
+        return infos, next_update
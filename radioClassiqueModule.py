@@ -1,13 +1,17 @@
+import io
 from lxml import etree 
-import requests
 from radioMetadataExtrator import AbstractRadioMetadataExtractor
 
 class RadioMetadataExtractor(AbstractRadioMetadataExtractor):
-    def __init__(self):
+    def __init__(self, session=None):
+        super(RadioMetadataExtractor, self).__init__(session)
         self._url = "https://data.radioclassique.fr/XML_Metadata/direct_2.xml" 
         self._artist = None
         self._interpreter = None
         self._title = None
+        self._song_found = False
+        self._etag = None
+        self._last_modified = None
 
     def get_artist(self):
         return self._artist
@@ -19,18 +23,43 @@ class RadioMetadataExtractor(AbstractRadioMetadataExtractor):
         return self._title
 
     def retrieve_current_metadata(self):
-        req = requests.get(self._url)
-        tree = etree.XML(req.text) # Let's open the xml file provided by radio classique 
+        headers = {} # Conditional request, the server answers 304 if the xml file did not change since the last poll
+        if self._etag is not None:
+            headers["If-None-Match"] = self._etag
+        if self._last_modified is not None:
+            headers["If-Modified-Since"] = self._last_modified
+        req = self._session.get(self._url, headers=headers)
+        if req.status_code == 304: # Not modified, the previous result is still valid
+            return self._song_found
         songFound = False
         self._artist = None 
         self._title = None 
         self._interpreter = None 
-        for song in tree.xpath("/xml/playlist/song"): # The xml file contains the list of songs 
-            if song.findtext("Status").lower() == "en ce moment": # Each song entry has a flag status. One song should have the "en ce moment" flag, which indicates it is the current song. 
+        self._song_found = False
+        for event, song in etree.iterparse(io.BytesIO(req.content), events=("end",), tag="song"): # The xml file contains the list of songs, parsed one by one until the current one
+            if not self.__is_playlist_song(song): # Only the /xml/playlist/song entries
+                continue
+            status = song.findtext("Status")
+            if status is not None and status.lower() == "en ce moment": # Each song entry has a flag status. One song should have the "en ce moment" flag, which indicates it is the current song. 
                 if int(song.findtext("type")) >= 21 and int(song.findtext("type")) <= 29: # Song entries also have a type. It appears that types between 20 and 30 are related to songs. Others can be advertisement or talks.
                     self._artist = song.findtext("name")
                     self._title = song.findtext("title")
                     self._interpreter = song.findtext("Interpretes")
                     songFound = True 
                 break
+            song.clear() # Free the already parsed songs
+        self._song_found = songFound
+        self._etag = req.headers.get("ETag")
+        self._last_modified = req.headers.get("Last-Modified")
         return songFound
+
+    def __is_playlist_song(self, song):
+        """
+            Returns True if the song element is an entry of the playlist
+            (/xml/playlist/song), and not a song element elsewhere. 
+        """
+        playlist = song.getparent()
+        if playlist is None or playlist.tag != "playlist":
+            return False
+        root = playlist.getparent()
+        return root is not None and root.tag == "xml" and root.getparent() is None
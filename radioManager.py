@@ -1,17 +1,37 @@
 #!/usr/bin/env python
 from radio import Radio
+from metrics import REGISTRY
+from stateStore import StateStore
 import time
 import threading
+import queue
 from queue import Queue
+from concurrent.futures import ThreadPoolExecutor
+
+# Delay between a button press and the end of the corresponding screen update
+DISPLAY_LATENCY = REGISTRY.histogram("radiobot_button_to_display_seconds", "Delay between a button press and the screen update", ("action",))
 
 class RadioManager():
     """
        This is the orchestrator of the radiobot program. 
        It receives actions from UI (volume, radio) and 
        update the player and the display. 
+       UI actions are queued and applied by a dedicated thread, 
+       which coalesces the bursts of actions (only the last selected
+       radio is tuned, successive volume changes are applied once), 
+       while the display is updated immediately on every action. 
+       The volume, the tuned radio and its last info are saved in the 
+       state store (if given), to be restored after a restart. 
 
     """
-    def __init__(self, radio_list, volume, volume_step, radio_info_check_interval, full_radio_name_pause, radio_indice, player, display):
+    TUNE = 1
+    VOLUME = 2
+    TUNE_DELAY = 0.25 # Delay (in seconds) without radio change before tuning the selected radio
+    METADATA_WORKERS = 2 # Max number of metadata fetches running at the same time
+    METADATA_DEADLINE = 30 # Delay (in seconds) after which a metadata fetch is abandoned
+    PLAYER_INFO_CHECK_INTERVAL = 300 # Delay (in seconds) between two checks of the player metadata ("vlc" radios), the changes being notified by the player
+    SAVED_INFO_MAX_AGE = 300 # Max age (in seconds) of a saved info displayed at startup
+    def __init__(self, radio_list, volume, volume_step, radio_info_check_interval, full_radio_name_pause, radio_indice, player, display, prefetcher=None, state_store=None):
         self._radios = radio_list
         self._indice = radio_indice
         self._volume = volume
@@ -19,76 +39,104 @@ class RadioManager():
         self._player = player
         self._display = display
         self._radio_info_check_interval = radio_info_check_interval
-        self._last_check = time.time()
+        self._next_check = time.time()+radio_info_check_interval
         self._previous_info = ""
         self._full_radio_name_pause = full_radio_name_pause
+        self._name_pause_end = 0
         self._queue = Queue()
         self._threads = []
-        self._lock = threading.Lock()
-        self._pending_changes = False
+        self._radio_change_listener = None
+        self._prefetcher = prefetcher
+        self._state_store = state_store
+        self._commands = Queue()
+        self._command_lock = threading.Lock()
+        self._tuned_indice = None
+        self._applied_volume = volume
+        self._generation = 0 # Incremented at each radio change, to detect the metadata of a previous radio
+        self._executor = ThreadPoolExecutor(max_workers=RadioManager.METADATA_WORKERS)
+        self._fetches = {} # Running or pending metadata fetches (future -> deadline)
+        self._fetch_lock = threading.Lock()
+        self._player.set_info_listener(self.__on_player_info)
+        threading.Thread(target=self.__process_commands, daemon=True).start()
 
     # Public functions
 
     def next(self):
         """
             Called by the UI radio next callback. 
-            Update the indice of the radios[] list and call the 
-            play_radio method, which will update the player and 
-            the display. 
+            Update the indice of the radios[] list, display the 
+            name of the selected radio and queue the radio change 
+            for the player. 
         """
-        if self._indice >= len(self._radios)-1 :
-            self._indice = 0
-        else:
-            self._indice += 1
-        self.play_radio()
+        press_time = time.monotonic()
+        with self._command_lock:
+            if self._indice >= len(self._radios)-1 :
+                self._indice = 0
+            else:
+                self._indice += 1
+            self.__display_radio()
+        self.__measure_display_latency(press_time, "radio")
+        self._commands.put(RadioManager.TUNE)
 
     def previous(self):
         """
             Called by the UI radio previous callback. 
-            Update the indice of the radios[] list and call the 
-            play_radio method, which will update the player and 
-            the display. 
+            Update the indice of the radios[] list, display the 
+            name of the selected radio and queue the radio change 
+            for the player. 
         """
-        if self._indice <= 0 :
-            self._indice = len(self._radios)-1
-        else:
-            self._indice -= 1
-        self.play_radio()
+        press_time = time.monotonic()
+        with self._command_lock:
+            if self._indice <= 0 :
+                self._indice = len(self._radios)-1
+            else:
+                self._indice -= 1
+            self.__display_radio()
+        self.__measure_display_latency(press_time, "radio")
+        self._commands.put(RadioManager.TUNE)
 
     def play_radio(self):
         """
             Asks the player to play the selected radio and the 
-            display to display the name of this selected radio.
+            display to display the name of this selected radio
+            (with its saved info, if recent).
         """
-        if not self._pending_changes:
-            self._pending_changes = True
-            self._display.on_thread(self._display.update_radio_info, None)
-            self._display.on_thread(self._display.update_radio, self.__get_short_name(), self.__get_long_name())
-            self._last_check = time.time()-self._radio_info_check_interval+self._full_radio_name_pause # To display the full radio name for few seconds
-            self._player.change_radio(self.__get_stream_url(), self.__get_media_type())
-            self._pending_changes = False
+        with self._command_lock:
+            self.__display_radio()
+            indice = self._indice
+        if self._state_store is not None:
+            saved_info = self._state_store.get("info")
+            if saved_info is not None and saved_info[0] == indice and time.time()-saved_info[2] < RadioManager.SAVED_INFO_MAX_AGE:
+                self.publish_radio_info(saved_info[1])
+        self.__tune(indice)
 
     def volume_up(self): 
         """
             Called by the UI volume UP callback. 
-            Update the volume target value and call the player, alsa
-            and the display for update.
+            Update the volume target value and the display, 
+            and queue the volume change for the player and alsa.
         """
-        if self._volume <= (100-self._volume_step):
-            self._volume += self._volume_step
-        self._player.change_volume(self._volume)
-        self._display.on_thread(self._display.display_volume, self._volume)
+        press_time = time.monotonic()
+        with self._command_lock:
+            if self._volume <= (100-self._volume_step):
+                self._volume += self._volume_step
+            self._display.on_thread(self._display.display_volume, self._volume)
+        self.__measure_display_latency(press_time, "volume")
+        self._commands.put(RadioManager.VOLUME)
 
     def volume_down(self): 
         """
             Called by the UI volume DOWN callback. 
-            Update the volume target value and call the player, alsa
-            and the display for update.
+            Update the volume target value and the display, 
+            and queue the volume change for the player and alsa.
         """
-        if self._volume >= (0+self._volume_step):
-            self._volume -= self._volume_step
-        self._player.change_volume(self._volume)
-        self._display.on_thread(self._display.display_volume, self._volume)
+        press_time = time.monotonic()
+        with self._command_lock:
+            if self._volume >= (0+self._volume_step):
+                self._volume -= self._volume_step
+            self._display.on_thread(self._display.display_volume, self._volume)
+        self.__measure_display_latency(press_time, "volume")
+        self._commands.put(RadioManager.VOLUME)
 
     def check_radio_info(self):
         """
@@ -99,18 +147,139 @@ class RadioManager():
         """
         # Check if info available
         if not self._queue.empty():
-            infos = self._queue.get()
-            if len(infos) > 0: # If some infos have been collected
-                if infos != self._previous_info: # And if this info is different from the current one (currently displayed)
-                    print ("New info available : "+infos)
-                    self._display.on_thread(self._display.update_radio_info, infos)
-                    self._previous_info = infos # Save this info as the current info for next check
+            generation, infos = self._queue.get()
+            if len(infos) > 0:
+                self.publish_radio_info(infos, generation)
+        elif self.get_info_check_delay() <= 0: # Run only if it is time to check (defined by the radio_info_check_interval param)
+            self.reset_info_check_timer()
+            future = self.request_radio_info()
+            if future is not None:
+                future.add_done_callback(self.__queue_radio_info)
+
+    def publish_radio_info(self, infos, generation=None):
+        """
+            Notifies the display if the given radio info is 
+            different from the one currently displayed. 
+            If the generation of the request is given, the info
+            is dropped if the radio changed since the request. 
+        """
+        if generation is not None and generation != self._generation: # Info of a previous radio
+            return
+        if len(infos) > 0: # If some infos have been collected
+            if infos != self._previous_info: # And if this info is different from the current one (currently displayed)
+                print ("New info available : "+infos)
+                self._display.on_thread(self._display.update_radio_info, infos)
+                self._previous_info = infos # Save this info as the current info for next check
+                if self._state_store is not None:
+                    self._state_store.update(StateStore.LAZY_WRITE_DELAY, info=[self._indice, infos, int(time.time())])
+        else:
+            self._display.on_thread(self._display.update_radio_info, None)
+
+    def get_info_check_delay(self):
+        """
+            Returns the number of seconds before the next radio info 
+            check (0 or negative if the check is already due). 
+        """
+        return self._next_check - time.time()
+
+    def reset_info_check_timer(self):
+        """
+            Restarts the radio_info_check_interval timer. 
+        """
+        self._next_check = time.time()+self._radio_info_check_interval
+
+    def set_radio_change_listener(self, listener):
+        """
+            Registers a function called (without argument) each time 
+            a new radio is played, or when the radio info check interval
+            is changed by a reloaded configuration. 
+        """
+        self._radio_change_listener = listener
+
+    def request_radio_info(self):
+        """
+            Submits a metadata fetch of the current radio to the worker pool.
+            Returns a future of a (generation, info) tuple, or None if all 
+            the workers are busy (fetches not over and not abandoned). 
+            Info is an empty string if no info available, and generation
+            must be given to publish_radio_info. 
+        """
+        now = time.time()
+        with self._fetch_lock:
+            for future, deadline in list(self._fetches.items()):
+                if now > deadline: # Abandoned (the worker is released at the end of the network timeout)
+                    del self._fetches[future]
+            if len(self._fetches) >= RadioManager.METADATA_WORKERS:
+                return None
+            future = self._executor.submit(self.__retrieve_radio_info, self._radios[self._indice], self._generation)
+            self._fetches[future] = now+RadioManager.METADATA_DEADLINE
+        future.add_done_callback(self.__forget_fetch)
+        return future
+
+    def update_config(self, radio_list, volume_step, radio_info_check_interval, full_radio_name_pause):
+        """
+            Applies the parameters of a reloaded configuration file. 
+            The radios whose entry did not change are kept (with their 
+            extractor module), so the radio currently played keeps playing
+            unless its own entry changed or was removed : it is then replaced
+            by the radio with the same stream URL (or at the same position), 
+            displayed and tuned again. 
+        """
+        with self._command_lock:
+            previous = {radio.settings: radio for radio in self._radios}
+            radios = [previous.get(radio.settings, radio) for radio in radio_list]
+            current = self._radios[self._indice]
+            previous_indice = self._indice
+            tuned = None
+            if self._tuned_indice is not None:
+                tuned = self._radios[self._tuned_indice]
+            self._radios = radios
+            self._volume_step = volume_step
+            interval_changed = radio_info_check_interval != self._radio_info_check_interval
+            if interval_changed: # A shorter interval applies from now, a longer one after the next check
+                self._next_check = min(self._next_check, time.time()+radio_info_check_interval)
+            self._radio_info_check_interval = radio_info_check_interval
+            self._full_radio_name_pause = full_radio_name_pause
+            self._tuned_indice = None
+            if tuned in radios:
+                self._tuned_indice = radios.index(tuned)
+            if current in radios: # Unchanged, only its position may have changed
+                self._indice = radios.index(current)
+                changed = False
             else:
-                self._display.on_thread(self._display.update_radio_info, None)
-        elif time.time() - self._last_check > self._radio_info_check_interval: # Run only if it is time to check (defined by the radio_info_check_interval param)
-            self._last_check = time.time()
-            #self._threads.append(threading.Thread(target=self.__get_info_async))
-            threading.Thread(target=self.__get_info_async).start()
+                urls = [radio.stream_url for radio in radios]
+                if current.stream_url in urls: # Same stream, other name or metadata module
+                    self._indice = urls.index(current.stream_url)
+                else:
+                    self._indice = min(self._indice, len(radios)-1)
+                self.__display_radio()
+                changed = True
+            indice = self._indice
+        if self._state_store is not None:
+            if self._tuned_indice is not None:
+                self._state_store.update(radio=self._tuned_indice)
+            if indice != previous_indice: # The saved info refers to the previous positions
+                self._state_store.update(info=None)
+        if self._prefetcher is not None:
+            self._prefetcher.set_radios(radios, radio_info_check_interval)
+        if changed:
+            self._commands.put(RadioManager.TUNE) # Same stream not restarted by the player
+        else:
+            self.__update_standby_radios(indice)
+        if interval_changed and self._radio_change_listener is not None: # The next check may have moved
+            self._radio_change_listener()
+
+    def get_queue_size(self):
+        """
+            Returns the number of radio info results waiting to be published
+        """
+        return self._queue.qsize()
+
+    def get_command_queue_size(self):
+        """
+            Returns the number of UI commands waiting to be applied
+        """
+        return self._commands.qsize()
 
     def get_current_volume(self):
         """
@@ -132,45 +301,156 @@ class RadioManager():
     def __get_short_name(self):
         return self._radios[self._indice].short_name
 
-    def __get_stream_url(self):
-        return self._radios[self._indice].stream_url
+    def __display_radio(self):
+        """
+            Asks the display to display the name of the selected radio
+            (the radio info is displayed after the next check, or 
+            immediately if available in the prefetch cache).
+        """
+        self._display.on_thread(self._display.update_radio_info, None)
+        self._display.on_thread(self._display.update_radio, self.__get_short_name(), self.__get_long_name())
+        self._previous_info = "" # The info of the previous radio is not displayed anymore
+        self._generation += 1
+        with self._fetch_lock:
+            futures = list(self._fetches)
+        for future in futures: # Cancelling the fetches of the previous radio which are not started yet (the done callbacks run here, and take the fetch lock)
+            future.cancel()
+        self._next_check = time.time()+self._full_radio_name_pause # To display the full radio name for few seconds
+        self._name_pause_end = self._next_check
+        if self._prefetcher is not None:
+            radio = self._radios[self._indice]
+            self._prefetcher.set_current_radio(radio)
+            infos = self._prefetcher.get_cached_info(radio)
+            if infos is not None: # Fresh info available in the prefetch cache, no need to wait for the first check
+                self.publish_radio_info(infos)
+                self._next_check = time.time()+self._radio_info_check_interval
+
+    def __measure_display_latency(self, press_time, action):
+        """
+            Queues a measure of the button-to-display latency behind the
+            display updates of an action (the display thread sends the 
+            screen changes of each command before running the next one). 
+        """
+        self._display.on_thread(lambda: DISPLAY_LATENCY.observe(time.monotonic()-press_time, action))
+
+    def __tune(self, indice):
+        """
+            Asks the player to play the radio of the given indice.
+        """
+        self._tuned_indice = indice
+        if self._state_store is not None:
+            self._state_store.update(radio=indice)
+        self._player.change_radio(self._radios[indice].stream_url, self._radios[indice].media_type, self._radios[indice].fallback_urls)
+        self.__update_standby_radios(indice)
+        if self._radio_change_listener is not None:
+            self._radio_change_listener()
+
+    def __update_standby_radios(self, indice):
+        """
+            Gives the radios adjacent to the given indice to the player
+            (kept buffered in zap mode). 
+        """
+        radios = self._radios
+        adjacent = [radios[(indice+1) % len(radios)], radios[(indice-1) % len(radios)]] # Next and previous radios
+        self._player.set_standby_radios([(radio.stream_url, radio.media_type) for radio in adjacent])
+
+    def __apply_volume(self):
+        """
+            Sends the current volume to the player (if changed).
+        """
+        with self._command_lock:
+            volume = self._volume
+        if volume != self._applied_volume:
+            self._applied_volume = volume
+            self._player.change_volume(volume)
+            if self._state_store is not None:
+                self._state_store.update(volume=volume)
+
+    def __apply_radio(self):
+        """
+            Tunes the selected radio (if changed).
+        """
+        with self._command_lock:
+            indice = self._indice
+        if indice != self._tuned_indice:
+            self.__tune(indice)
+
+    def __process_commands(self):
+        """
+            Applies the queued UI commands (dedicated thread). 
+            All the commands available at once are coalesced : the volume
+            is applied once and the radio is tuned only when no radio 
+            change has been received for TUNE_DELAY seconds. 
+        """
+        tune_deadline = None
+        while True:
+            timeout = None
+            if tune_deadline is not None:
+                timeout = max(0, tune_deadline-time.monotonic())
+            commands = set()
+            try:
+                commands.add(self._commands.get(timeout=timeout))
+                while not self._commands.empty():
+                    commands.add(self._commands.get_nowait())
+            except queue.Empty:
+                pass
+            try:
+                if RadioManager.VOLUME in commands:
+                    self.__apply_volume()
+                if RadioManager.TUNE in commands: # Waiting for the end of the radio changes
+                    tune_deadline = time.monotonic()+RadioManager.TUNE_DELAY
+                elif tune_deadline is not None and time.monotonic() >= tune_deadline:
+                    tune_deadline = None
+                    self.__apply_radio()
+            except Exception as e:
+                print (str(e))
+
+    def __retrieve_radio_info(self, radio, generation):
+        """
+            Fetches the metadata of a radio (worker pool). 
+            Returns the generation of the request and the metadata as a 
+            single string (empty string if no info available). 
+        """
+        infos = ""
+        if generation != self._generation: # Radio changed while waiting for a worker
+            return generation, infos
+        if radio.extractor_module_name is not None and radio.extractor_module_name.lower() == "vlc":
+            infos = self._player.get_infos()
+            if generation == self._generation: # Next changes are notified by the player, only checking again in case of a missed event
+                self._next_check = time.time()+RadioManager.PLAYER_INFO_CHECK_INTERVAL
+        else:
+            infos, next_update = radio.retrieve_info()
+            if generation == self._generation and next_update is not None and next_update < self._next_check: # Metadata will change before the next check, let's check at this time
+                self._next_check = next_update
+            if self._prefetcher is not None: # Keeping the prefetch cache up to date with the current radio
+                self._prefetcher.store(radio, infos, next_update)
+        return generation, infos
+
+    def __on_player_info(self, infos):
+        """
+            Player info listener (called by the player thread). The info is 
+            published if the selected radio reads its metadata from the player
+            and is the radio currently played (not waiting to be tuned). 
+        """
+        with self._command_lock:
+            radio = self._radios[self._indice]
+            generation = self._generation
+            if self._tuned_indice != self._indice:
+                return
+        if radio.extractor_module_name is not None and radio.extractor_module_name.lower() == "vlc" and time.time() >= self._name_pause_end: # Not during the display of the full radio name
+            self.publish_radio_info(infos, generation)
 
-    def __get_media_type(self):
-        return self._radios[self._indice].media_type
+    def __forget_fetch(self, future):
+        with self._fetch_lock:
+            self._fetches.pop(future, None)
 
-    def __get_info_async(self):
+    def __queue_radio_info(self, future):
+        """
+            Done callback of the fetches requested by check_radio_info. 
+        """
+        if future.cancelled():
+            return
         try:
-            infos = ""
-            if self._radios[self._indice].extractor_module_name.lower() == "vlc":
-                infos = self._player.get_infos()
-            else:
-                module = self._radios[self._indice].get_module() # Get the module related to this radio
-                if module is not None: # If a module is available
-                    self._lock.acquire()
-                    if module.retrieve_current_metadata(): # If metadata are available at this time
-                        artist = module.get_artist()
-                        title = module.get_title()
-                        interpreter = module.get_interpreter()
-                        if not isinstance(artist, str):
-                            artist = ""
-            
-                        if not isinstance(title, str):
-                            title = ""
-            
-                        if not isinstance(interpreter, str):
-                            interpreter = ""
-            
-                        infos = artist
-                        if len(artist) > 0 and (len(title) > 0 or len(interpreter) > 0):
-                            infos += " - "
-            
-                        infos += title
-                        if len(title) > 0 and len(interpreter) > 0:
-                            infos += " - "
-            
-                        infos += interpreter
-                    self._lock.release() 
-            if len(infos) > 0:
-                self._queue.put(infos)
+            self._queue.put(future.result())
         except Exception as e:
             print (str(e))
@@ -1,12 +1,27 @@
 from abc import ABC,abstractmethod
+from httpSession import get_shared_session
 
 class AbstractRadioMetadataExtractor(ABC):
     """
         This abstract class defines a metadata extractor module for a specific webradio
         As all the webradios are different, a dedicated module must be
         developped to retrieve the metadata (artist, title, interpreter(s)). 
+        HTTP requests must be done with the session attribute, which is 
+        shared between all the modules (keep-alive connection pool). 
     """
 
+    def __init__(self, session=None):
+        if session is None:
+            session = get_shared_session()
+        self._session = session
+
+    @property
+    def session(self):
+        """
+            Returns the HTTP session used by this module.
+        """
+        return self._session
+
     @abstractmethod
     def retrieve_current_metadata(self):
         """
@@ -43,3 +58,13 @@ class AbstractRadioMetadataExtractor(ABC):
             retrieve_current_metadata must be called first. 
         """
         pass
+
+    def get_next_update_time(self):
+        """
+            Returns the time (timestamp, in seconds) at which the metadata
+            of the current song is expected to change (end of the song), 
+            or None if unknown. The radio manager uses it to check 
+            the metadata again at this exact time. 
+            retrieve_current_metadata must be called first. 
+        """
+        return None
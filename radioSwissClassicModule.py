@@ -1,14 +1,65 @@
-import requests 
-import json 
-import pprint 
-import time 
-import re
+import codecs
+from html.parser import HTMLParser
 from radioMetadataExtrator import AbstractRadioMetadataExtractor
-from bs4 import BeautifulSoup
 
-class RadioMetadataExtractor(AbstractRadioMetadataExtractor):
+class LiveBlockParser(HTMLParser):
+    """
+        Incremental parser of the radio homepage, which only reads the
+        current song of the div#live block. The done attribute is set
+        at the end of this block, the rest of the page can be ignored.
+    """
     def __init__(self):
-        self._url = "http://www.radioswissclassic.ch/fr" 
+        super(LiveBlockParser, self).__init__(convert_charrefs=True)
+        self.artist = None
+        self.title = None
+        self.done = False
+        self._live_depth = 0 # Number of open divs of the live block (0 if outside)
+        self._field = None # Attribute read from the current span, if any
+        self._span_depth = 0 # Number of spans open inside the current span
+        self._text = []
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == "div":
+            if self._live_depth > 0:
+                self._live_depth += 1
+            elif dict(attrs).get("id") == "live":
+                self._live_depth = 1
+        elif tag == "span" and self._live_depth > 0:
+            if self._field is not None:
+                self._span_depth += 1
+                return
+            classes = (dict(attrs).get("class") or "").split()
+            if "titletag" in classes and self.artist is None: # The "titletag" span contains the artist, and the "artist" span the title
+                self._field = "artist"
+            elif "artist" in classes and self.title is None:
+                self._field = "title"
+            self._text = []
+
+    def handle_endtag(self, tag):
+        if self.done or self._live_depth == 0:
+            return
+        if tag == "span" and self._field is not None:
+            if self._span_depth > 0:
+                self._span_depth -= 1
+            else:
+                setattr(self, self._field, "".join(self._text).strip())
+                self._field = None
+        elif tag == "div":
+            self._live_depth -= 1
+            if self._live_depth == 0: # End of the live block
+                self.done = True
+
+    def handle_data(self, data):
+        if self._field is not None:
+            self._text.append(data)
+
+class RadioMetadataExtractor(AbstractRadioMetadataExtractor):
+    CHUNK_SIZE = 8192 # Bytes of the page read (and parsed) at once
+    def __init__(self, session=None):
+        super(RadioMetadataExtractor, self).__init__(session)
+        self._url = "http://www.radioswissclassic.ch/fr"
         self._artist = None
         self._interpreter = None
         self._title = None
@@ -24,17 +75,36 @@ class RadioMetadataExtractor(AbstractRadioMetadataExtractor):
 
     def retrieve_current_metadata(self):
         songFound = False
+        self._artist = None
+        self._title = None
+        self._interpreter = None
+        req = self._session.get(self._url, stream=True) # Network and HTTP errors are raised to the caller
         try:
-            req = requests.get(self._url)
-            soup = BeautifulSoup(req.text, features="lxml")
-            live = soup.find('div', {'id': 'live'})
-            artist_span = live.find('span', {'class': 'titletag'})
-            self._artist = artist_span.get_text().strip()
-            title_span = live.find('span', {'class': 'artist'})
-            self._title = title_span.get_text().strip()
+            req.raise_for_status()
+            parser = LiveBlockParser()
+            decoder = self.__get_decoder(req)
+            for chunk in req.iter_content(chunk_size=RadioMetadataExtractor.CHUNK_SIZE): # The page is parsed while downloaded
+                parser.feed(decoder.decode(chunk))
+                if parser.done: # The rest of the page is not downloaded
+                    break
+            parser.close()
+        finally:
+            req.close()
+        if parser.artist is not None and parser.title is not None: # Live block found in the page
+            self._artist = parser.artist
+            self._title = parser.title
             songFound = True
-        except:
-            self._artist = None
-            self._title = None
-            self._interpreter = None
         return songFound
+
+    def __get_decoder(self, req):
+        """
+            Returns an incremental decoder for the charset of the page
+            (utf-8 if not given in the headers).
+        """
+        encoding = "utf-8"
+        if "charset" in req.headers.get("Content-Type", "").lower() and req.encoding is not None:
+            encoding = req.encoding
+        try:
+            return codecs.getincrementaldecoder(encoding)(errors="replace")
+        except LookupError: # Unknown charset
+            return codecs.getincrementaldecoder("utf-8")(errors="replace")
@@ -0,0 +1,564 @@
+#!/usr/bin/env python
+import os
+import sys
+import time
+import threading
+import queue
+
+class VirtualButtonBus():
+    """
+        In-process stand-in of the RPi.GPIO module (subset used by radiobot).
+        Buttons are pressed with the press method, and the event callbacks
+        are called by a dedicated thread, one after the other, with the
+        bouncetime filtering of RPi.GPIO.
+    """
+    # Same values as RPi.GPIO
+    BOARD = 10
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_DOWN = 21
+    PUD_UP = 22
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self._mode = None
+        self._levels = {} # Channel -> level
+        self._callbacks = {} # Channel -> (callback, bouncetime in seconds)
+        self._last_events = {} # Channel -> time of the last event (monotonic clock)
+        self._events = queue.Queue()
+        self._lock = threading.Lock()
+        threading.Thread(target=self.__dispatch_events, daemon=True).start()
+
+    def setmode(self, mode):
+        self._mode = mode
+
+    def setup(self, channel, direction, pull_up_down=None):
+        with self._lock:
+            if direction == VirtualButtonBus.IN:
+                self._levels[channel] = VirtualButtonBus.HIGH if pull_up_down == VirtualButtonBus.PUD_UP else VirtualButtonBus.LOW
+            else:
+                self._levels.setdefault(channel, VirtualButtonBus.LOW)
+
+    def output(self, channel, value):
+        with self._lock:
+            self._levels[channel] = value
+
+    def input(self, channel):
+        with self._lock:
+            return self._levels.get(channel, VirtualButtonBus.LOW)
+
+    def add_event_detect(self, channel, edge, callback=None, bouncetime=None):
+        with self._lock:
+            self._callbacks[channel] = (callback, (bouncetime or 0)/1000)
+
+    def remove_event_detect(self, channel):
+        with self._lock:
+            self._callbacks.pop(channel, None)
+
+    def cleanup(self):
+        with self._lock:
+            self._callbacks.clear()
+            self._levels.clear()
+
+    def press(self, channel):
+        """
+            Simulates a button press on a channel (can be called from any thread).
+            The event is dropped if it comes within the bouncetime of the
+            previous event of this channel, like a bouncing button.
+        """
+        with self._lock:
+            if channel not in self._callbacks:
+                return False
+            callback, bouncetime = self._callbacks[channel]
+            now = time.monotonic()
+            if now-self._last_events.get(channel, -bouncetime) < bouncetime:
+                return False
+            self._last_events[channel] = now
+        if callback is not None:
+            self._events.put((callback, channel))
+        return True
+
+    def __dispatch_events(self):
+        while True:
+            callback, channel = self._events.get()
+            try:
+                callback(channel)
+            except Exception as e:
+                print ("Button callback error : "+str(e))
+
+class VirtualLcd():
+    """
+        In-process stand-in of the serial LCD screen (same interface as
+        serial.Serial). The written bytes are decoded as the LCD does
+        (0xFE command protocol and text) into a 2x16 text frame.
+        If a baud rate is given, each write lasts the transmission time
+        of its data, like a blocking serial write.
+    """
+    COLUMNS = 16
+    ROWS = 2
+    COMMAND = 0xFE
+    # Number of parameter bytes of the known commands
+    COMMAND_SIZES = {
+        0x58: 0,  # Clear screen
+        0x48: 0,  # Cursor home
+        0x47: 2,  # Set cursor position (1-based column and row)
+        0x4C: 0,  # Cursor back
+        0x4D: 0,  # Cursor forward
+        0x51: 0,  # Autoscroll on
+        0x52: 0,  # Autoscroll off
+        0x42: 1,  # Display on
+        0x46: 0,  # Display off
+        0x99: 1,  # Set brightness
+        0x50: 1,  # Set contrast
+        0xD0: 3,  # Set backlight color
+        0x40: 32, # Set startup message
+    }
+
+    def __init__(self, baud_rate=None, echo=False):
+        self._baud_rate = baud_rate
+        self._echo = echo
+        self._frame = [[" "]*VirtualLcd.COLUMNS for row in range(VirtualLcd.ROWS)]
+        self._row = 0
+        self._col = 0
+        self._command = None # Command being decoded (bytearray) or None
+        self._startup_message = ""
+        self._write_count = 0
+        self._bytes_written = 0
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def write(self, data):
+        """
+            Decodes the data (bytes, or list of ints) and updates the frame.
+            Returns the number of bytes written.
+        """
+        if isinstance(data, str):
+            data = data.encode()
+        data = bytes(data)
+        with self._lock:
+            previous = self.__get_lines()
+            for byte in data:
+                self.__decode(byte)
+            self._write_count += 1
+            self._bytes_written += len(data)
+            lines = self.__get_lines()
+        if self._baud_rate:
+            time.sleep(len(data)*10/self._baud_rate) # 8 data bits, start and stop bits
+        if self._echo and lines != previous:
+            print ("[LCD] |"+lines[0]+"|")
+            print ("[LCD] |"+lines[1]+"|")
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._closed = True
+
+    def get_lines(self):
+        """
+            Returns the two lines currently displayed (strings).
+        """
+        with self._lock:
+            return self.__get_lines()
+
+    @property
+    def startup_message(self):
+        return self._startup_message
+
+    @property
+    def write_count(self):
+        return self._write_count
+
+    @property
+    def bytes_written(self):
+        return self._bytes_written
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def __get_lines(self):
+        return ["".join(row) for row in self._frame]
+
+    def __decode(self, byte):
+        if self._command is not None: # Reading the command and its parameters
+            self._command.append(byte)
+            size = VirtualLcd.COMMAND_SIZES.get(self._command[0], 0)
+            if len(self._command) > size:
+                self.__run_command(self._command[0], self._command[1:])
+                self._command = None
+        elif byte == VirtualLcd.COMMAND:
+            self._command = bytearray()
+        elif byte in (0x0D, 0x0A): # Line break
+            self._row = (self._row+1) % VirtualLcd.ROWS
+            self._col = 0
+        else:
+            self.__put_char(chr(byte) if 0x20 <= byte < 0x7F else "?")
+
+    def __put_char(self, char):
+        self._frame[self._row][self._col] = char
+        self._col += 1
+        if self._col >= VirtualLcd.COLUMNS: # Wrapping to the next line (autoscroll off)
+            self._col = 0
+            self._row = (self._row+1) % VirtualLcd.ROWS
+
+    def __run_command(self, command, parameters):
+        if command == 0x58:
+            self._frame = [[" "]*VirtualLcd.COLUMNS for row in range(VirtualLcd.ROWS)]
+            self._row = 0
+            self._col = 0
+        elif command == 0x48:
+            self._row = 0
+            self._col = 0
+        elif command == 0x47:
+            self._col = min(max(parameters[0]-1, 0), VirtualLcd.COLUMNS-1)
+            self._row = min(max(parameters[1]-1, 0), VirtualLcd.ROWS-1)
+        elif command == 0x4C:
+            self._col = max(self._col-1, 0)
+        elif command == 0x4D:
+            self._col = min(self._col+1, VirtualLcd.COLUMNS-1)
+        elif command == 0x40:
+            self._startup_message = parameters.decode("ascii", "replace")
+
+class FakeEventManager():
+    """
+        Stand-in of a vlc.EventManager. The callbacks are called by the
+        timer threads of the fake players, like the libVLC threads.
+    """
+    def __init__(self):
+        self._callbacks = {} # Event type -> list of (callback, args)
+
+    def event_attach(self, event_type, callback, *args):
+        self._callbacks.setdefault(event_type, []).append((callback, args))
+        return 0
+
+    def event_detach(self, event_type):
+        self._callbacks.pop(event_type, None)
+
+    def send(self, event_type, new_cache=None):
+        event = FakeEvent(event_type, new_cache)
+        for callback, args in list(self._callbacks.get(event_type, [])):
+            callback(event, *args)
+
+class FakeEvent():
+    def __init__(self, event_type, new_cache):
+        self.type = event_type
+        self.u = FakeEventData(new_cache)
+
+class FakeEventData():
+    def __init__(self, new_cache):
+        self.new_cache = new_cache
+
+class FakeMedia():
+    """
+        Stand-in of a vlc.Media. Local files have a fixed duration,
+        network streams are endless and announce a title (NowPlaying)
+        when they start playing. The input statistics count the bytes
+        received since the start of the playback (until a stall).
+    """
+    BYTE_RATE = 16000 # Bytes per second (128 kbit/s)
+
+    def __init__(self, mrl, backend):
+        self._mrl = mrl
+        self._backend = backend
+        self._duration = backend.song_duration
+        self._now_playing = None
+        self._reading_since = None # Start of the playback (monotonic clock)
+        self._event_manager = FakeEventManager()
+        self.start_time = 0 # Position (in seconds) of the start of the playback
+        if "://" in mrl:
+            self._duration = None
+
+    def get_mrl(self):
+        return self._mrl
+
+    def event_manager(self):
+        return self._event_manager
+
+    def add_option(self, option):
+        if option.lstrip(":").startswith("start-time="):
+            self.start_time = float(option.split("=", 1)[1])
+
+    def parse_with_options(self, flags, timeout):
+        return 0
+
+    def parse_async(self):
+        pass
+
+    def get_duration(self):
+        if self._duration is None:
+            return -1
+        return int(self._duration*1000)
+
+    def get_stats(self, stats):
+        read_bytes = 0
+        if self._reading_since is not None:
+            end = self._backend.stalled_urls.get(self._mrl, time.monotonic())
+            read_bytes = int(max(end-self._reading_since, 0)*FakeMedia.BYTE_RATE)
+        stats.read_bytes = read_bytes
+        stats.demux_read_bytes = read_bytes
+        return True
+
+    def set_reading(self, reading):
+        self._reading_since = time.monotonic() if reading else None
+
+    def get_meta(self, meta):
+        if meta == FakeVlc.Meta.Title:
+            return os.path.splitext(os.path.basename(self._mrl))[0]
+        if meta == FakeVlc.Meta.Artist:
+            return "Simulation"
+        if meta == FakeVlc.Meta.NowPlaying:
+            return self._now_playing
+        return None
+
+    def announce(self, now_playing):
+        """
+            Sets the title announced by a stream (MediaMetaChanged event).
+        """
+        self._now_playing = now_playing
+        self._event_manager.send(FakeVlc.EventType.MediaMetaChanged)
+
+class FakeMediaPlayer():
+    """
+        Stand-in of a vlc.MediaPlayer. A media starts buffering after the
+        connection delay of the backend and playing after its buffering
+        delay, and a local file stops at the end of its duration. The
+        player events are sent by timer threads.
+    """
+    def __init__(self, backend):
+        self._backend = backend
+        self._media = None
+        self._start_time = None # Time of the first audio (monotonic clock), None if stopped
+        self._volume = 100
+        self._mute = False
+        self._timers = []
+        self._event_manager = FakeEventManager()
+
+    def event_manager(self):
+        return self._event_manager
+
+    def set_media(self, media):
+        self.stop()
+        self._media = media
+
+    def get_media(self):
+        return self._media
+
+    def play(self):
+        if self._media is None:
+            return -1
+        self.stop()
+        connect_delay = self._backend.connect_delay
+        delay = connect_delay+self._backend.buffering_delay
+        self._start_time = time.monotonic()+delay
+        if connect_delay > 0: # Connection to the server, then buffering
+            self.__schedule(connect_delay, self._event_manager.send, FakeVlc.EventType.MediaPlayerBuffering, 0.0)
+        else:
+            self._event_manager.send(FakeVlc.EventType.MediaPlayerBuffering, 0.0)
+        self.__schedule(delay, self.__start)
+        duration = self._media.get_duration()
+        if duration > 0:
+            self.__schedule(delay+max(duration/1000-self._media.start_time, 0), self._event_manager.send, FakeVlc.EventType.MediaPlayerEndReached)
+        return 0
+
+    def stop(self):
+        for timer in self._timers:
+            timer.cancel()
+        self._timers = []
+        self._start_time = None
+        if self._media is not None:
+            self._media.set_reading(False)
+
+    def release(self):
+        self.stop()
+        self._media = None
+
+    def is_playing(self):
+        if self._start_time is None:
+            return 0
+        now = time.monotonic()
+        if now < self._start_time: # Buffering
+            return 0
+        duration = self._media.get_duration()
+        if duration > 0 and self.get_time() >= duration: # End of the media
+            return 0
+        return 1
+
+    def get_length(self):
+        if self._media is None or self._start_time is None or time.monotonic() < self._start_time:
+            return 0
+        return max(self._media.get_duration(), 0)
+
+    def get_time(self):
+        if self._start_time is None:
+            return -1
+        return max(int((time.monotonic()-self._start_time+self._media.start_time)*1000), 0)
+
+    def audio_set_volume(self, volume):
+        self._volume = volume
+        return 0
+
+    def audio_get_volume(self):
+        return self._volume
+
+    def audio_set_mute(self, mute):
+        self._mute = bool(mute)
+
+    def audio_get_mute(self):
+        return self._mute
+
+    def __schedule(self, delay, function, *args):
+        timer = threading.Timer(delay, function, args)
+        timer.daemon = True
+        self._timers.append(timer)
+        timer.start()
+
+    def __start(self):
+        media = self._media
+        if media is not None and media.get_mrl() in self._backend.failing_urls: # Server not available
+            self._start_time = None
+            self._event_manager.send(FakeVlc.EventType.MediaPlayerEncounteredError)
+            return
+        if media is not None:
+            media.set_reading(True)
+        self._event_manager.send(FakeVlc.EventType.MediaPlayerBuffering, 100.0)
+        self._event_manager.send(FakeVlc.EventType.MediaPlayerPlaying)
+        if media is not None and media.get_duration() < 0: # Stream title
+            media.announce("Simulation - "+media.get_mrl())
+
+class FakeVlcInstance():
+    def __init__(self, backend):
+        self._backend = backend
+
+    def media_player_new(self):
+        return FakeMediaPlayer(self._backend)
+
+    def media_new(self, mrl):
+        return FakeMedia(mrl, self._backend)
+
+class FakeVlc():
+    """
+        Stand-in of the python-vlc module (subset used by the player manager),
+        with configurable buffering delay, song duration and connection
+        delay to the stream servers (in seconds).
+        Network failures can be simulated with the fail and stall methods.
+    """
+    class Meta():
+        Title = 0
+        Artist = 1
+        NowPlaying = 12
+
+    class MediaParseFlag():
+        local = 0
+        network = 1
+
+    class EventType():
+        MediaMetaChanged = 0
+        MediaPlayerBuffering = 259
+        MediaPlayerPlaying = 260
+        MediaPlayerEndReached = 265
+        MediaPlayerEncounteredError = 266
+
+    class MediaStats():
+        def __init__(self):
+            self.read_bytes = 0
+            self.demux_read_bytes = 0
+
+    def __init__(self, buffering_delay=0.5, song_duration=180, connect_delay=0):
+        self.buffering_delay = buffering_delay
+        self.song_duration = song_duration
+        self.connect_delay = connect_delay
+        self.failing_urls = set() # URLs whose server does not answer
+        self.stalled_urls = {} # URL -> time of the stall (monotonic clock)
+
+    def Instance(self, *args):
+        return FakeVlcInstance(self)
+
+    def fail(self, url, failing=True):
+        """
+            Makes the connections to an URL fail (or work again).
+        """
+        if failing:
+            self.failing_urls.add(url)
+        else:
+            self.failing_urls.discard(url)
+
+    def stall(self, url, stalled=True):
+        """
+            Stops (or restores) the data received from an URL.
+        """
+        if stalled:
+            self.stalled_urls[url] = time.monotonic()
+        else:
+            self.stalled_urls.pop(url, None)
+
+class VirtualMixer():
+    """
+        Stand-in of the alsa mixer, only keeping the volume.
+    """
+    def __init__(self):
+        self.volume = None
+
+    def set_volume(self, volume):
+        self.volume = volume
+
+class Simulation():
+    """
+        Set of stand-ins used to run radiobot without its hardware
+        (GPIO buttons, serial LCD, VLC and alsa), and console to press
+        the virtual buttons.
+    """
+    KEY_INTERVAL = 0.05 # Delay (in seconds) between two keys of the same console command
+
+    def __init__(self, baud_rate=None, buffering_delay=0.5, song_duration=180, connect_delay=0, echo=True):
+        self.gpio = VirtualButtonBus()
+        self.lcd = VirtualLcd(baud_rate, echo)
+        self.vlc = FakeVlc(buffering_delay, song_duration, connect_delay)
+        self.mixer = VirtualMixer()
+        self._keys = {}
+
+    def start_console(self, keys):
+        """
+            Starts reading button commands on the standard input.
+            keys maps a character to a GPIO channel. A command is a
+            sequence of keys, optionally followed by a repeat count and
+            the interval between repetitions (in seconds), "n 20 0.3" for example.
+        """
+        self._keys = keys
+        print ("Simulation keys : "+", ".join(key+" (GPIO "+str(channel)+")" for key, channel in keys.items())+", s (screen)")
+        threading.Thread(target=self.__read_console, daemon=True).start()
+
+    def run_command(self, command):
+        """
+            Runs a console command (see start_console).
+        """
+        parts = command.split()
+        if len(parts) == 0:
+            return
+        if parts[0] == "s":
+            for line in self.lcd.get_lines():
+                print ("[LCD] |"+line+"|")
+            return
+        count = int(parts[1]) if len(parts) > 1 else 1
+        interval = float(parts[2]) if len(parts) > 2 else 0.25
+        for i in range(count):
+            if i > 0:
+                time.sleep(interval)
+            for j, key in enumerate(parts[0]):
+                if key in self._keys:
+                    if j > 0:
+                        time.sleep(Simulation.KEY_INTERVAL)
+                    self.gpio.press(self._keys[key])
+
+    def __read_console(self):
+        for line in sys.stdin:
+            try:
+                self.run_command(line)
+            except ValueError:
+                print ("Invalid command : "+line.strip())
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+import json
+import os
+import threading
+import time
+
+class StateStore():
+    """
+        This class keeps the state of the radiobot (volume, radio indice,
+        last known metadata, position in the folders) in the settings cache
+        file, so that it is restored after a power cut.
+        Changes are not written immediately : they are coalesced and written
+        by a dedicated thread at the end of their delay (WRITE_DELAY for the
+        volume and the radio, LAZY_WRITE_DELAY for the metadata and the songs),
+        and nothing is written if the content did not change, to limit the
+        SD card writes. Each write goes to a temporary file which is synced
+        and renamed, so that the file is never corrupted.
+        The first two lines of the file are still the volume and the radio
+        indice (previous settings.cache format), followed by the other values
+        as a json object.
+    """
+    WRITE_DELAY = 5 # Max delay (in seconds) before writing a volume or radio change
+    LAZY_WRITE_DELAY = 60 # Max delay (in seconds) before writing a metadata or song change
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._state = {}
+        self._written = None # Content of the file, as last read or written
+        self._deadline = None # Time of the next write (None if nothing to write)
+        self._condition = threading.Condition()
+        self.__load()
+        threading.Thread(target=self.__write_loop, daemon=True).start()
+
+    def get(self, key, default=None):
+        """
+            Returns a value of the state (default if not saved).
+        """
+        with self._condition:
+            return self._state.get(key, default)
+
+    def update(self, delay=WRITE_DELAY, **values):
+        """
+            Changes some values of the state, which are written within
+            the given delay (in seconds), with the other pending changes.
+        """
+        with self._condition:
+            changed = False
+            for key, value in values.items():
+                if self._state.get(key) != value:
+                    self._state[key] = value
+                    changed = True
+            if not changed:
+                return
+            deadline = time.monotonic()+delay
+            if self._deadline is None or deadline < self._deadline:
+                self._deadline = deadline
+                self._condition.notify()
+
+    def set_folder_position(self, url, song, position=0, delay=LAZY_WRITE_DELAY):
+        """
+            Saves the song (and the position in this song, in seconds)
+            played in the folder of the given url.
+        """
+        with self._condition:
+            folders = dict(self._state.get("folders", {}))
+        folders[url] = [song, round(position, 1)]
+        self.update(delay, folders=folders)
+
+    def flush(self):
+        """
+            Writes the pending changes immediately (program exit).
+        """
+        with self._condition:
+            self._deadline = None
+            self.__write()
+
+    def __write_loop(self):
+        """
+            Writes the pending changes at the end of their delay (dedicated thread).
+        """
+        with self._condition:
+            while True:
+                if self._deadline is None:
+                    self._condition.wait()
+                elif time.monotonic() < self._deadline:
+                    self._condition.wait(self._deadline-time.monotonic())
+                else:
+                    self._deadline = None
+                    self.__write()
+
+    def __write(self):
+        """
+            Writes the state in a temporary file, then renames it (skipped
+            if the content of the file would not change).
+        """
+        state = dict(self._state)
+        content = str(state.pop("volume", ""))+"\n"+str(state.pop("radio", ""))+"\n"+json.dumps(state, sort_keys=True)+"\n"
+        if content == self._written:
+            return
+        try:
+            temp_path = self._file_path+".tmp"
+            with open(temp_path, "w") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno()) # Data on the card before the rename
+            os.replace(temp_path, self._file_path)
+            self._written = content
+        except Exception as e: # To not crash the program if cannot save settings
+            print (str(e))
+
+    def __load(self):
+        """
+            Reads the file (empty state if not available). Files of the previous
+            format only contain the volume and the radio indice.
+        """
+        try:
+            with open(self._file_path) as f:
+                content = f.read()
+        except Exception:
+            return
+        lines = content.splitlines()
+        try:
+            if len(lines) >= 2:
+                self._state["volume"] = int(lines[0])
+                self._state["radio"] = int(lines[1])
+            if len(lines) > 2:
+                self._state.update(json.loads(lines[2]))
+            self._written = content
+        except Exception as e: # Corrupted file, the values read before the error are kept
+            print (str(e))
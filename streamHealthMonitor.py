@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+import time
+
+class StreamHealthMonitor():
+    """
+        This class watches the health of a network stream from the VLC
+        input statistics (bytes read by the input and by the demuxer) and
+        buffering events. A stream is considered stalled when no byte has
+        been received for STALL_DELAY seconds, when it keeps buffering
+        for STALL_DELAY seconds, or when it does not start playing within
+        CONNECT_TIMEOUT seconds. It also computes the reconnection delays :
+        each URL of the radio is tried once, then the delay is doubled at
+        each new round (up to MAX_BACKOFF).
+    """
+    CHECK_INTERVAL = 1 # Delay (in seconds) between two checks of the statistics
+    STALL_DELAY = 2 # Delay (in seconds) without data after which the stream is stalled
+    CONNECT_TIMEOUT = 10 # Max delay (in seconds) between the connection and the first audio
+    STABLE_DELAY = 30 # Delay (in seconds) of healthy playback after which the previous failures are forgotten
+    BASE_BACKOFF = 1 # Reconnection delay (in seconds) of the first round of URLs
+    MAX_BACKOFF = 30
+
+    def __init__(self):
+        self._failures = 0
+        self.reset()
+
+    def reset(self):
+        """
+            Starts monitoring a new connection (the failures are kept).
+        """
+        self._connection_time = time.time()
+        self._playing_since = None
+        self._buffering_since = None
+        self._read_bytes = None
+        self._progress_time = None # Last time data was received
+
+    def forget_failures(self):
+        self._failures = 0
+
+    def on_playing(self):
+        now = time.time()
+        self._buffering_since = None
+        if self._playing_since is None:
+            self._playing_since = now
+            self._progress_time = now
+
+    def on_buffering(self, cache):
+        """
+            Takes the buffering percentage of a buffering event.
+        """
+        if self._playing_since is None: # Initial buffering, covered by the connection timeout
+            return
+        if cache < 100:
+            if self._buffering_since is None:
+                self._buffering_since = time.time()
+        else:
+            self._buffering_since = None
+
+    def check(self, stats):
+        """
+            Takes the (read_bytes, demux_read_bytes) statistics of the
+            media (None if not available), and returns True if the
+            stream is stalled.
+        """
+        now = time.time()
+        if self._playing_since is None:
+            return now-self._connection_time > StreamHealthMonitor.CONNECT_TIMEOUT
+        if self._buffering_since is not None and now-self._buffering_since > StreamHealthMonitor.STALL_DELAY:
+            return True
+        if stats is None: # No statistics from this VLC version, only the events are used
+            return False
+        if self._read_bytes is None or any(count > previous for count, previous in zip(stats, self._read_bytes)): # Data received (input or demuxer)
+            self._read_bytes = stats
+            self._progress_time = now
+        elif now-self._progress_time > StreamHealthMonitor.STALL_DELAY:
+            return True
+        if self._failures > 0 and now-self._playing_since > StreamHealthMonitor.STABLE_DELAY:
+            self._failures = 0
+        return False
+
+    def record_failure(self, url_count):
+        """
+            Records a failure of the stream and returns the delay (in seconds)
+            before connecting to the next URL.
+        """
+        self._failures += 1
+        rounds = (self._failures-1)//max(url_count, 1)
+        return min(StreamHealthMonitor.BASE_BACKOFF*(2**min(rounds, 16)), StreamHealthMonitor.MAX_BACKOFF)